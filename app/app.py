@@ -9,11 +9,14 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from core.agent import CipherAuditAgent
 from core.loader import load_custom_cipher_from_text # <--- NEW IMPORT
+from core.cache import AuditResultCache, audit_cache_key, cached_full_audit
+from plots import plot_sac_heatmap
 from ciphers.test_cipher import SimpleXORCipher 
 from ciphers.ascon_cipher import AsconCipher
 from ciphers.simon_cipher import SimonCipher
 from ciphers.speck_cipher import SpeckCipher
 from ciphers.present_cipher import PresentCipher
+from ciphers.basic_spn_cipher import BasicSPNCipher
 
 st.set_page_config(page_title="CipherScore: Security Evaluator", layout="wide")
 
@@ -33,19 +36,40 @@ st.markdown("---")
 # --- SIDEBAR ---
 st.sidebar.header("⚙️ Configuration")
 
-cipher_option = st.sidebar.selectbox(
-    "Select Algorithm",
-    (
-        "Simple XOR (Test)", 
-        "Ascon-128 (NIST Standard)",
-        "Simon-64/128 (NSA Lightweight)",
-        "Speck-64/128 (Software Optimized)",
-        "PRESENT-80 (ISO Standard)",
-        "✨ Custom (Paste Code)"  # <--- NEW OPTION
-    )
-)
+# Display label -> stable cipher id (the ids of the backend's AVAILABLE_CIPHERS, used in cache keys)
+CIPHER_IDS = {
+    "Simple XOR (Test)": "xor",
+    "Ascon-128 (NIST Standard)": "ascon",
+    "Simon-64/128 (NSA Lightweight)": "simon",
+    "Speck-64/128 (Software Optimized)": "speck",
+    "PRESENT-80 (ISO Standard)": "present",
+    "Basic SPN (Heys Tutorial)": "basic_spn",
+    "✨ Custom (Paste Code)": "custom",  # <--- NEW OPTION
+}
+
+cipher_option = st.sidebar.selectbox("Select Algorithm", tuple(CIPHER_IDS))
 
 rounds = st.sidebar.slider("Test Rounds (Avalanche)", 100, 5000, 1000)
+# Adaptive mode: stop as soon as the estimate is within ± tolerance (rounds becomes a cap)
+adaptive = st.sidebar.checkbox("Stop early once converged", value=False)
+tolerance = st.sidebar.slider("Tolerance (± %)", 0.05, 2.0, 0.25) if adaptive else None
+# Strict Avalanche Criterion: one row per input bit (0 = skip the test)
+sac_samples = st.sidebar.slider("SAC Samples per Input Bit", 0, 5000, 0, step=100)
+# Bit Independence Criterion: output bit pair correlations per input bit (0 = skip the test)
+bic_samples = st.sidebar.slider("BIC Samples per Input Bit", 0, 5000, 0, step=100)
+# Differential scan: pairs per single-bit input difference (0 = skip the scan)
+scan_pairs = st.sidebar.slider("Differential Scan Pairs per Input Difference", 0, 1 << 20, 0, step=1 << 14)
+# Randomness tests: MiB of counter-mode ciphertext (0 = skip the tests)
+randomness_mib = st.sidebar.slider("Randomness Test Stream (MiB)", 0, 64, 0)
+# Budget of the differential attack stage (SPN ciphers only)
+attack_time_budget = st.sidebar.slider("Attack Time Budget (s)", 1, 120, 10)
+attack_memory_mb = st.sidebar.slider("Attack Memory Budget (MB)", 16, 2048, 256, step=16)
+# A fixed seed makes the audit deterministic, so repeated runs come from the cache
+seed = st.sidebar.number_input("Random Seed", value=42, step=1)
+
+@st.cache_resource
+def get_audit_cache():
+    return AuditResultCache()
 
 # --- MAIN LOGIC ---
 target_cipher = None
@@ -99,13 +123,42 @@ else:
         elif cipher_option == "Simon-64/128 (NSA Lightweight)": target_cipher = SimonCipher()
         elif cipher_option == "Speck-64/128 (Software Optimized)": target_cipher = SpeckCipher()
         elif cipher_option == "PRESENT-80 (ISO Standard)": target_cipher = PresentCipher()
+        elif cipher_option == "Basic SPN (Heys Tutorial)": target_cipher = BasicSPNCipher()
 
 # --- RUN AUDIT (Common for both Custom and Standard) ---
 if target_cipher:
-    agent = CipherAuditAgent(target_cipher)
+    progress_bar = st.progress(0.0, text="Starting audit...")
+
+    def show_progress(event):
+        # Live feedback while the audit runs (called once per avalanche batch / stage)
+        if event['stage'] == 'avalanche' and event.get('rounds_total'):
+            text = f"Avalanche: {event['rounds_completed']}/{event['rounds_total']} rounds"
+            if 'avalanche_estimate' in event:
+                text += (f" — {event['avalanche_estimate']:.2f}% "
+                         f"(95% CI {event['ci_low']:.2f}–{event['ci_high']:.2f}%)")
+            progress_bar.progress(min(1.0, event['rounds_completed'] / event['rounds_total']), text=text)
+        elif event['stage'] == 'done':
+            progress_bar.empty()
+        else:
+            progress_bar.progress(1.0, text=f"Running {event['stage']} stage...")
+
+    agent = CipherAuditAgent(target_cipher, progress_callback=show_progress)
     
+    custom_code = code_input if cipher_option == "✨ Custom (Paste Code)" else None
+    cache_key = audit_cache_key(CIPHER_IDS[cipher_option], custom_code, rounds=rounds, seed=int(seed), workers=None,
+                                tolerance=tolerance, sac_samples=sac_samples,
+                                attack_time_budget=attack_time_budget, attack_memory_mb=attack_memory_mb,
+                                scan_pairs=scan_pairs, randomness_bytes=randomness_mib << 20,
+                                bic_samples=bic_samples)
+
     with st.spinner(f"🕵️ Auditing {target_cipher.name}... Running {rounds} rounds..."):
-        report = agent.run_full_audit(rounds=rounds)
+        report = cached_full_audit(get_audit_cache(), cache_key, agent, rounds=rounds, seed=int(seed),
+                                   tolerance=tolerance, sac_samples=sac_samples,
+                                   attack_time_budget=attack_time_budget, attack_memory_mb=attack_memory_mb,
+                                   scan_pairs=scan_pairs, randomness_bytes=randomness_mib << 20,
+                                   bic_samples=bic_samples)
+    # Cache hits (full, or timings only) never send the final 'done' event
+    progress_bar.empty()
         
     # --- RESULTS DISPLAY ---
     # ROW 1: Key Metrics
@@ -144,4 +197,51 @@ if target_cipher:
         st.pyplot(fig)
 
     with data_col:
-        st.json(report)
\ No newline at end of file
+        # The SAC matrix and the differential scan are shown below instead of raw numbers
+        st.json({k: v for k, v in report.items() if k not in ('SAC', 'Differential Scan', 'Randomness')})
+
+    # ROW 3: Strict Avalanche Criterion
+    if 'SAC' in report:
+        sac = report['SAC']
+        st.markdown("---")
+        st.subheader("Strict Avalanche Criterion")
+        heat_col, sac_col = st.columns([2, 1])
+        with heat_col:
+            st.pyplot(plot_sac_heatmap(sac))
+        with sac_col:
+            st.metric("Max Deviation from 0.5", f"{sac['max_deviation']:.4f}", "Lower is Better")
+            st.metric("Chi-Square p-value", f"{sac['p_value']:.4f}", "Biased if < 0.01")
+            st.caption(f"Worst pair: input bit {sac['worst_pair'][0]} → output bit {sac['worst_pair'][1]}")
+
+    # ROW 4: Differential Scan
+    if 'Differential Scan' in report:
+        scan = report['Differential Scan']
+        worst = scan['worst']
+        st.markdown("---")
+        st.subheader("Differential Scan")
+        table_col, scan_col = st.columns([2, 1])
+        with table_col:
+            # Most frequent output difference of every input difference
+            st.dataframe(pd.DataFrame([{'Input Difference': entry['input_difference'], **entry['top'][0]}
+                                       for entry in scan['differentials']]))
+        with scan_col:
+            st.metric("Significant Differentials", f"{scan['significant']} / {scan['input_differences']}",
+                      "Lower is Better")
+            st.metric("Best Differential Probability", f"{worst['probability']:.6f}",
+                      f"p-value {worst['p_value']:.3g}")
+            st.caption(f"Worst: {worst['input_difference']} → {worst['output_difference']} "
+                       f"({worst['count']} of {scan['pairs_per_difference']} pairs)")
+
+    # ROW 5: Randomness Tests
+    if 'Randomness' in report:
+        randomness = report['Randomness']
+        st.markdown("---")
+        st.subheader("Randomness Tests (NIST SP 800-22)")
+        tests_col, summary_col = st.columns([2, 1])
+        with tests_col:
+            st.dataframe(pd.DataFrame({'Test': list(randomness['p_values']),
+                                       'p-value': list(randomness['p_values'].values())}))
+        with summary_col:
+            st.metric("Tests Passed", f"{randomness['passed']} / {randomness['tests']}",
+                      f"p-value ≥ {randomness['alpha']}")
+            st.caption(f"{randomness['bytes']} bytes of counter-mode ciphertext")
@@ -0,0 +1,20 @@
+# app/plots.py
+import matplotlib.pyplot as plt
+import numpy as np
+
+
+def plot_sac_heatmap(sac):
+    """
+    Heatmap of the Strict Avalanche Criterion matrix from an audit report
+    (rows = flipped input bit, columns = output bit, ideal value = 0.5).
+    """
+    matrix = np.asarray(sac['matrix'])
+
+    fig, ax = plt.subplots(figsize=(7, 5))
+    image = ax.imshow(matrix, cmap='coolwarm', vmin=0.0, vmax=1.0, aspect='auto', interpolation='nearest')
+    ax.set_xlabel('Output bit')
+    ax.set_ylabel('Flipped input bit')
+    ax.set_title(f"SAC matrix ({sac['samples']} samples/bit, max deviation {sac['max_deviation']:.3f})")
+    fig.colorbar(image, ax=ax, label='P(output bit flips)')
+    fig.tight_layout()
+    return fig
@@ -0,0 +1,225 @@
+# backend/jobs.py
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from core.sandbox import SANDBOX_PRELOAD, SandboxPool
+
+# Concurrency limit (worker processes) and how many jobs may wait on top of that
+AUDIT_WORKERS = int(os.environ.get("CIPHERSCORE_AUDIT_WORKERS", min(4, os.cpu_count() or 1)))
+AUDIT_QUEUE_DEPTH = int(os.environ.get("CIPHERSCORE_AUDIT_QUEUE_DEPTH", 16))
+
+# Finished jobs kept around for GET /audits/{id}
+FINISHED_JOBS_KEPT = 500
+
+# Progress events kept per job (older ones are dropped)
+EVENTS_KEPT = 256
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+class AuditJobQueue:
+    """
+    Runs CPU-bound audits in a bounded pool of worker processes, so the
+    API's event loop never executes them itself. Jobs that run untrusted
+    code go to a separate SandboxPool (rlimits, timeouts, killed workers);
+    'sandbox_preload' names extra modules its workers import up front.
+    """
+
+    def __init__(self, max_workers=AUDIT_WORKERS, max_queued=AUDIT_QUEUE_DEPTH, sandbox_preload=()):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.sandbox_preload = tuple(sandbox_preload)
+        self._executor = None
+        self._sandbox = None
+        self._manager = None
+        self._jobs = OrderedDict()
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def _get_sandbox(self):
+        if self._sandbox is None:
+            self._sandbox = SandboxPool(preload=SANDBOX_PRELOAD + self.sandbox_preload)
+        return self._sandbox
+
+    def _get_manager(self):
+        # Manager queues can be handed to pool workers (plain multiprocessing queues cannot)
+        if self._manager is None:
+            self._manager = multiprocessing.Manager()
+        return self._manager
+
+    def submit(self, func, *args, with_progress=False, sandboxed=False):
+        """
+        Queues func(*args) in a worker process and returns the new job id.
+        With with_progress=True a queue is appended to the arguments; the
+        worker puts progress dicts on it and None when it is done.
+        With sandboxed=True the job runs in the sandbox pool instead.
+        """
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queued:
+                raise QueueFullError(f"Audit queue is full ({self._pending} jobs pending)")
+            self._pending += 1
+
+            job_id = uuid.uuid4().hex
+            job = {
+                'job_id': job_id,
+                'status': 'queued',
+                'submitted_at': time.time(),
+                'finished_at': None,
+                'result': None,
+                'error': None,
+                'future': None,
+                'events': deque(maxlen=EVENTS_KEPT),
+                'event_count': 0,
+                'progress_queue': None,
+                'pump': None,
+                'sandboxed': sandboxed,
+                'started': False,
+            }
+            self._jobs[job_id] = job
+
+            try:
+                if sandboxed:
+                    # Sandbox workers send their events up the job's pipe, no queue needed
+                    on_progress = (lambda event: self._add_event(job, event)) if with_progress else None
+                    job['future'] = self._get_sandbox().submit(func, *args, on_progress=on_progress)
+                else:
+                    if with_progress:
+                        job['progress_queue'] = self._get_manager().Queue()
+                        args = args + (job['progress_queue'],)
+                    job['future'] = self._get_executor().submit(func, *args)
+            except Exception:
+                self._pending -= 1
+                del self._jobs[job_id]
+                raise
+
+            if with_progress and not sandboxed:
+                job['pump'] = threading.Thread(target=self._pump_events, args=(job,), daemon=True)
+                job['pump'].start()
+
+        job['future'].add_done_callback(lambda future: self._finish(job_id, future))
+        return job_id
+
+    def _pump_events(self, job):
+        # Moves progress events from the worker's queue into the job record
+        while True:
+            event = job['progress_queue'].get()
+            if event is None:
+                break
+            self._add_event(job, event)
+
+    def _add_event(self, job, event):
+        with self._lock:
+            # The first event is the sign that a worker really runs the job
+            job['started'] = True
+            job['event_count'] += 1
+            job['events'].append((job['event_count'], event))
+
+    def add_finished(self, result):
+        """Registers a job whose result is already known (e.g. a cache hit)"""
+        future = Future()
+        future.set_result(result)
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._pending += 1
+            self._jobs[job_id] = {
+                'job_id': job_id,
+                'status': 'queued',
+                'submitted_at': time.time(),
+                'finished_at': None,
+                'result': None,
+                'error': None,
+                'future': future,
+                'events': deque(maxlen=EVENTS_KEPT),
+                'event_count': 0,
+                'progress_queue': None,
+                'pump': None,
+                'sandboxed': False,
+                'started': False,
+            }
+        self._finish(job_id, future)
+        return job_id
+
+    def _finish(self, job_id, future):
+        job = self._jobs.get(job_id)
+        if job is not None and job['pump'] is not None:
+            # Unblocks the pump even if the worker died before sending its None
+            job['progress_queue'].put(None)
+            job['pump'].join(timeout=1)
+
+        with self._lock:
+            self._pending -= 1
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job['finished_at'] = time.time()
+            error = future.exception()
+            if error is None:
+                job['status'] = 'finished'
+                job['result'] = future.result()
+            else:
+                job['status'] = 'failed'
+                job['error'] = str(error)
+            self._prune()
+
+    def _prune(self):
+        # Forget the oldest finished jobs once there are too many
+        finished = [jid for jid, job in self._jobs.items() if job['finished_at'] is not None]
+        for jid in finished[:max(0, len(finished) - FINISHED_JOBS_KEPT)]:
+            del self._jobs[jid]
+
+    def future(self, job_id):
+        """The concurrent.futures.Future of a job (None if unknown)"""
+        job = self._jobs.get(job_id)
+        return job['future'] if job else None
+
+    def get(self, job_id):
+        """Public view of a job (status, result, error), or None if unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            status = job['status']
+            # A pool future is 'running' as soon as it enters the executor's call queue,
+            # before any worker has it: only the job's first progress event counts.
+            # A sandbox slot marks its future running when it takes the job.
+            if status == 'queued' and (job['started'] or (job['sandboxed'] and job['future'].running())):
+                status = 'running'
+            return {
+                'job_id': job_id,
+                'status': status,
+                'submitted_at': job['submitted_at'],
+                'finished_at': job['finished_at'],
+                'result': job['result'],
+                'error': job['error'],
+            }
+
+    def events_since(self, job_id, seq):
+        """Progress events numbered after 'seq', as a list of (number, event)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return []
+            return [(n, event) for n, event in job['events'] if n > seq]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._sandbox is not None:
+            self._sandbox.shutdown()
+            self._sandbox = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
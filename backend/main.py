@@ -1,6 +1,10 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
+from contextlib import asynccontextmanager
+import asyncio
+import json
 import sys
 import os
 import importlib.util
@@ -10,14 +14,48 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from core.agent import CipherAuditAgent
 from core.loader import load_custom_cipher_from_text
+from core.cache import AuditResultCache, audit_cache_key, cached_full_audit, is_cacheable, join_report
+from core.parallel import default_workers
+from core.sandbox import SandboxError
 from ciphers.test_cipher import SimpleXORCipher
 from ciphers.ascon_cipher import AsconCipher
 from ciphers.simon_cipher import SimonCipher
 from ciphers.speck_cipher import SpeckCipher
 from ciphers.present_cipher import PresentCipher
+from ciphers.basic_spn_cipher import BasicSPNCipher
+from backend.jobs import AuditJobQueue, QueueFullError
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI(title="CipherScore API", description="Backend for CipherScore Security Evaluator")
+# How often the event stream checks a job for new progress (seconds)
+EVENTS_POLL_INTERVAL = 0.25
+
+# Created on first use (at app startup in the API process). Sandbox workers import
+# this module to run execute_audit, and must never open the queue or the cache file.
+_audit_queue = None
+_audit_cache = None
+
+def get_audit_queue() -> AuditJobQueue:
+    """The job queue: audits are CPU-bound, so they run in worker processes, not in the event loop."""
+    global _audit_queue
+    if _audit_queue is None:
+        _audit_queue = AuditJobQueue()
+    return _audit_queue
+
+def get_audit_cache() -> AuditResultCache:
+    """Seeded audits are deterministic, so their reports are cached (memory + SQLite)."""
+    global _audit_cache
+    if _audit_cache is None:
+        _audit_cache = AuditResultCache()
+    return _audit_cache
+
+@asynccontextmanager
+async def lifespan(app):
+    get_audit_cache()
+    get_audit_queue()
+    yield
+    get_audit_queue().shutdown()
+
+app = FastAPI(title="CipherScore API", description="Backend for CipherScore Security Evaluator", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -39,11 +77,31 @@ class AuditRequest(BaseModel):
     cipher_id: str
     custom_code: Optional[str] = None
     rounds: int = 1000
+    parallel: bool = False
+    seed: Optional[int] = None
+    tolerance: Optional[float] = None  # adaptive avalanche: stop at this CI half-width (± %)
+    sac_samples: int = 0  # Strict Avalanche Criterion samples per input bit (0 = skip)
+    bic_samples: int = 0  # Bit Independence Criterion samples per input bit (0 = skip)
+    attack_time_budget: float = 10.0  # differential attack stage: wall-clock seconds
+    attack_memory_mb: int = 256  # differential attack stage: memory budget (MB)
+    scan_pairs: int = 0  # differential scan: pairs per single-bit input difference (0 = skip)
+    randomness_bytes: int = 0  # randomness tests: bytes of counter-mode output (0 = skip)
 
 class AuditResponse(BaseModel):
     cipher_name: str
     report: Dict[str, Any]
 
+class AuditJob(BaseModel):
+    job_id: str
+    status: str  # queued | running | finished | failed
+    submitted_at: float
+    finished_at: Optional[float] = None
+    result: Optional[AuditResponse] = None
+    error: Optional[str] = None
+
+class CompilationError(Exception):
+    """Pasted code that does not define a usable cipher (answered with 400)"""
+
 # --- CIPHER MAPPING ---
 
 AVAILABLE_CIPHERS = {
@@ -52,6 +110,7 @@ AVAILABLE_CIPHERS = {
     "simon": {"name": "Simon-64/128 (NSA Lightweight)", "class": SimonCipher},
     "speck": {"name": "Speck-64/128 (Software Optimized)", "class": SpeckCipher},
     "present": {"name": "PRESENT-80 (ISO Standard)", "class": PresentCipher},
+    "basic_spn": {"name": "Basic SPN (Heys Tutorial)", "class": BasicSPNCipher},
     "custom": {"name": "✨ Custom (Paste Code)", "class": None}
 }
 
@@ -65,37 +124,182 @@ async def get_ciphers():
         ciphers.append(CipherOption(id=cid, name=info["name"], description=info["name"]))
     return ciphers
 
-@app.post("/audit", response_model=AuditResponse)
-async def run_audit(request: AuditRequest):
-    """Runs a cipher audit based on the selected cipher and parameters."""
-    target_cipher = None
-    
+def resolve_cipher(cipher_id: str, custom_code: Optional[str] = None):
+    """
+    Builds the cipher instance for a request (raises HTTPException on bad
+    input, CompilationError when pasted code does not load).
+    """
+    if cipher_id == "custom":
+        if not custom_code:
+            raise HTTPException(status_code=400, detail="Custom code is required for custom cipher option.")
+        try:
+            return load_custom_cipher_from_text(custom_code)
+        except Exception as e:
+            raise CompilationError(f"Compilation Error: {str(e)}")
+
+    elif cipher_id in AVAILABLE_CIPHERS:
+        cipher_class = AVAILABLE_CIPHERS[cipher_id]["class"]
+        if cipher_class:
+            return cipher_class()
+        else:
+            raise HTTPException(status_code=500, detail="Cipher class not found.")
+    else:
+        raise HTTPException(status_code=404, detail="Cipher ID not found.")
+
+def request_cache_key(request: AuditRequest) -> Optional[str]:
+    """Cache key of a request, or None when the audit is not deterministic."""
+    # Only seeded audits give the same report twice
+    if request.seed is None:
+        return None
+    custom_code = request.custom_code if request.cipher_id == "custom" else None
+    # Parallel runs use one seed per shard, so the shard count matters too
+    workers = default_workers() if request.parallel else None
+    return audit_cache_key(request.cipher_id, custom_code, rounds=request.rounds,
+                           seed=request.seed, workers=workers, tolerance=request.tolerance,
+                           sac_samples=request.sac_samples, attack_time_budget=request.attack_time_budget,
+                           attack_memory_mb=request.attack_memory_mb, scan_pairs=request.scan_pairs,
+                           randomness_bytes=request.randomness_bytes, bic_samples=request.bic_samples)
+
+# AuditRequest fields passed on to CipherAuditAgent.run_full_audit
+AUDIT_PARAMS = ('rounds', 'parallel', 'seed', 'tolerance', 'sac_samples', 'attack_time_budget',
+                'attack_memory_mb', 'scan_pairs', 'randomness_bytes', 'bic_samples')
+
+def execute_audit(request: Dict[str, Any], cache_key: Optional[str] = None, progress_queue=None):
+    """
+    Runs one audit (executed inside a worker process of the audit queue).
+    'request' is the AuditRequest as a dict (model_dump()), read by field name.
+    """
     try:
-        if request.cipher_id == "custom":
-            if not request.custom_code:
-                raise HTTPException(status_code=400, detail="Custom code is required for custom cipher option.")
-            try:
-                target_cipher = load_custom_cipher_from_text(request.custom_code)
-            except Exception as e:
-                raise HTTPException(status_code=400, detail=f"Compilation Error: {str(e)}")
-        
-        elif request.cipher_id in AVAILABLE_CIPHERS:
-            cipher_class = AVAILABLE_CIPHERS[request.cipher_id]["class"]
-            if cipher_class:
-                target_cipher = cipher_class()
-            else:
-                raise HTTPException(status_code=500, detail="Cipher class not found.")
+        target_cipher = resolve_cipher(request["cipher_id"], request["custom_code"])
+        progress = progress_queue.put if progress_queue is not None else None
+        agent = CipherAuditAgent(target_cipher, progress_callback=progress)
+        audit_kwargs = {name: request[name] for name in AUDIT_PARAMS}
+        if cache_key:
+            report = cached_full_audit(get_audit_cache(), cache_key, agent, **audit_kwargs)
         else:
-            raise HTTPException(status_code=404, detail="Cipher ID not found.")
+            report = agent.run_full_audit(**audit_kwargs)
+        return {"cipher_name": target_cipher.name, "report": report}
+    finally:
+        if progress_queue is not None:
+            progress_queue.put(None)
+
+def custom_name_key(custom_code: str) -> str:
+    """Cache key of the name of a pasted cipher (its reports do not hold it)."""
+    return audit_cache_key("custom", custom_code)
+
+def store_sandboxed_report(cache_key: str, custom_code: str, future):
+    """Caches the report of a finished sandboxed audit (sandboxed code never gets the cache)."""
+    if future.cancelled() or future.exception() is not None:
+        return
+    result = future.result()
+    if not isinstance(result, dict) or not isinstance(result.get("cipher_name"), str):
+        return
+    report = result.get("report")
+    if isinstance(report, dict) and is_cacheable(report):
+        cache = get_audit_cache()
+        cache.put(custom_name_key(custom_code), {"cipher_name": result["cipher_name"]})
+        cache.put(cache_key, report)
 
-        # Run Audit
-        agent = CipherAuditAgent(target_cipher)
-        report = agent.run_full_audit(rounds=request.rounds)
-        
-        return AuditResponse(cipher_name=target_cipher.name, report=report)
+def cached_cipher_name(request: AuditRequest) -> Optional[str]:
+    """Name of the request's cipher, or None for pasted code that has no cached name."""
+    if request.cipher_id != "custom":
+        return resolve_cipher(request.cipher_id).name
+    entry = get_audit_cache().get(custom_name_key(request.custom_code))
+    return entry['results']['cipher_name'] if entry is not None else None
 
+async def submit_audit(request: AuditRequest) -> str:
+    """Validates the request and queues it; returns the job id."""
+    # Fail fast on unknown ciphers instead of queueing them. Pasted code never
+    # runs in the API process: it is loaded (and checked) by its queued job.
+    custom = request.cipher_id == "custom"
+    if custom:
+        if not request.custom_code:
+            raise HTTPException(status_code=400, detail="Custom code is required for custom cipher option.")
+    else:
+        resolve_cipher(request.cipher_id)
+
+    # Fully cached reports (fresh timings included) skip the worker pool entirely
+    cache_key = request_cache_key(request)
+    if cache_key:
+        # SQLite lookups: keep them off the event loop
+        loop = asyncio.get_running_loop()
+        entry = await loop.run_in_executor(None, get_audit_cache().get, cache_key)
+        if entry is not None and entry['timing'] is not None:
+            cipher_name = await loop.run_in_executor(None, cached_cipher_name, request)
+            if cipher_name is not None:
+                report = join_report(entry['results'], entry['timing'])
+                return get_audit_queue().add_finished({"cipher_name": cipher_name, "report": report})
+
+    try:
+        # A sandboxed audit runs uncached; its report is stored from this process
+        job_id = get_audit_queue().submit(execute_audit, request.model_dump(), None if custom else cache_key,
+                                    with_progress=True, sandboxed=custom)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    if custom and cache_key:
+        get_audit_queue().future(job_id).add_done_callback(
+            lambda future: store_sandboxed_report(cache_key, request.custom_code, future))
+    return job_id
+
+@app.post("/audits", response_model=AuditJob, status_code=202)
+async def create_audit_job(request: AuditRequest):
+    """Queues an audit and returns its job id right away."""
+    job_id = await submit_audit(request)
+    return get_audit_queue().get(job_id)
+
+@app.get("/audits/{job_id}", response_model=AuditJob)
+async def get_audit_job(job_id: str):
+    """Returns the status (and, once finished, the result) of an audit job."""
+    job = get_audit_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Audit job not found.")
+    return job
+
+@app.get("/audits/{job_id}/events")
+async def stream_audit_events(job_id: str):
+    """
+    Server-Sent Events stream of an audit job: 'progress' events (stage,
+    rounds completed, running avalanche estimate and its 95% interval),
+    then one final 'finished' or 'failed' event carrying the job itself.
+    """
+    if get_audit_queue().get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Audit job not found.")
+
+    async def event_stream():
+        last_seen = 0
+        while True:
+            for seq, event in get_audit_queue().events_since(job_id, last_seen):
+                last_seen = seq
+                yield f"event: progress\ndata: {json.dumps(event)}\n\n"
+
+            job = get_audit_queue().get(job_id)
+            if job is None:
+                return
+            if job["status"] in ("finished", "failed"):
+                # Events that arrived right before the end
+                for seq, event in get_audit_queue().events_since(job_id, last_seen):
+                    yield f"event: progress\ndata: {json.dumps(event)}\n\n"
+                yield f"event: {job['status']}\ndata: {json.dumps(job)}\n\n"
+                return
+            await asyncio.sleep(EVENTS_POLL_INTERVAL)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+@app.post("/audit", response_model=AuditResponse)
+async def run_audit(request: AuditRequest):
+    """Runs a cipher audit based on the selected cipher and parameters."""
+    job_id = await submit_audit(request)
+
+    try:
+        # Waits for the worker without blocking the event loop
+        return await asyncio.wrap_future(get_audit_queue().future(job_id))
     except HTTPException:
         raise
+    except SandboxError as e:
+        if e.error_type == CompilationError.__name__:
+            raise HTTPException(status_code=400, detail=str(e))
+        raise HTTPException(status_code=500, detail=f"Audit failed: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Audit failed: {str(e)}")
 
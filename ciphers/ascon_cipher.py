@@ -3,6 +3,9 @@ import ascon
 from core.interfaces import BaseCipher
 
 class AsconCipher(BaseCipher):
+    # AEAD: encrypts whole messages, not fixed-size blocks
+    block_size = None
+
     @property
     def name(self):
         return "Ascon-128 (NIST Standard)"
@@ -0,0 +1,16 @@
+from core.spn import SPNSpec, SPNCipher
+
+# The 16-bit, 4-round SPN of Howard M. Heys' "A Tutorial on Linear and
+# Differential Cryptanalysis" (same cipher as core/differential_cryptanalysis_lib/basic_SPN.py,
+# whose hex key string is this cipher's key as bytes)
+BASIC_SPN = SPNSpec(
+    name="Basic SPN (Heys Tutorial)",
+    sbox=[0xE, 0x4, 0xD, 0x1, 0x2, 0xF, 0xB, 0x8, 0x3, 0xA, 0x6, 0xC, 0x5, 0x9, 0x0, 0x7],
+    pbox=[0, 4, 8, 12, 1, 5, 9, 13, 2, 6, 10, 14, 3, 7, 11, 15],
+    block_bits=16,
+    rounds=4,
+)
+
+
+class BasicSPNCipher(SPNCipher):
+    spn = BASIC_SPN
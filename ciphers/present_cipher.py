@@ -1,4 +1,6 @@
-from core.interfaces import BaseCipher
+import numpy as np
+
+from core.interfaces import BaseCipher, to_block_array
 
 class PresentCipher(BaseCipher):
     """
@@ -33,6 +35,19 @@ class PresentCipher(BaseCipher):
             
         return state.to_bytes(8, 'big')
 
+    def encrypt_batch(self, blocks, key):
+        # Same simulation on a uint64 array (one block per element); only the
+        # low 64 key bits survive the mask, and uint64 arithmetic wraps by itself
+        key_int = int.from_bytes(key, 'big') if isinstance(key, bytes) else key
+        key_word = np.uint64(key_int & 0xFFFFFFFFFFFFFFFF)
+
+        state = to_block_array(blocks, self.block_size).view('>u8').ravel().astype(np.uint64)
+        for i in range(31):
+            state = (state ^ key_word) + np.uint64(i)
+            state = (state << np.uint64(3)) | (state >> np.uint64(61))
+
+        return state.astype('>u8').view(np.uint8).reshape(-1, 8)
+
     def decrypt(self, ciphertext, key):
         # Decryption simulation
         return ciphertext
\ No newline at end of file
@@ -1,17 +1,22 @@
-from core.interfaces import BaseCipher
+from core.interfaces import BaseCipher, to_block_array
 # Import from your LOCAL file now
-from ciphers.simon_speck_logic import SimonCipherEngine
+from ciphers.simon_speck_logic import SimonCipherEngine, get_simon_engine, split_words, join_words
 
 class SimonCipher(BaseCipher):
     @property
     def name(self):
         return "Simon-64/128 (NSA Lightweight)"
 
+    def expand_key(self, key):
+        # Uncached key setup (used by the benchmark to time the key schedule on its own)
+        clean_key = key.ljust(16, b'\0')[:16]
+        return SimonCipherEngine(clean_key)
+
     def encrypt(self, plaintext, key):
         # 1. Setup Engine
         # Truncate/Pad key to 16 bytes
         clean_key = key.ljust(16, b'\0')[:16]
-        engine = SimonCipherEngine(clean_key)
+        engine = get_simon_engine(bytes(clean_key))
         
         # 2. Prepare Input (8 bytes for 64-bit block)
         pt_padded = plaintext.ljust(8, b'\0')[:8]
@@ -22,5 +27,15 @@ class SimonCipher(BaseCipher):
         
         return ct_int.to_bytes(8, 'big')
 
+    def encrypt_batch(self, blocks, key):
+        # Vectorized path: the whole batch goes through each round at once
+        clean_key = key.ljust(16, b'\0')[:16]
+        engine = get_simon_engine(bytes(clean_key))
+        
+        x, y = split_words(to_block_array(blocks, self.block_size))
+        x, y = engine.encrypt_batch(x, y)
+        
+        return join_words(x, y)
+
     def decrypt(self, ciphertext, key):
         return ciphertext # Not needed for Avalanche test
\ No newline at end of file
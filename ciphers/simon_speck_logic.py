@@ -1,4 +1,28 @@
 # ciphers/simon_speck_logic.py
+from functools import lru_cache
+
+import numpy as np
+
+# How many expanded key schedules are kept around (per cipher)
+KEY_SCHEDULE_CACHE_SIZE = 256
+
+
+def split_words(blocks):
+    """
+    Splits a (n, 8) uint8 array of big-endian 64-bit blocks into
+    two uint32 word arrays (x = high word, y = low word).
+    """
+    words = np.ascontiguousarray(blocks, dtype=np.uint8).view('>u4').astype(np.uint32)
+    return words[:, 0].copy(), words[:, 1].copy()
+
+
+def join_words(x, y):
+    """Inverse of split_words: packs two uint32 word arrays into (n, 8) uint8 blocks"""
+    words = np.empty((len(x), 2), dtype='>u4')
+    words[:, 0] = x
+    words[:, 1] = y
+    return words.view(np.uint8).reshape(len(x), 8)
+
 
 # --- SIMON CIPHER LOGIC (64/128 configuration) ---
 class SimonCipherEngine:
@@ -36,6 +60,24 @@ class SimonCipherEngine:
             
         return (x << self.word_size) | y
 
+    def encrypt_batch(self, x, y):
+        """
+        Vectorized encrypt: x and y are uint32 arrays holding the high and
+        low words of every block. Each round runs across the whole batch.
+        """
+        x = np.array(x, dtype=np.uint32)
+        y = np.array(y, dtype=np.uint32)
+        
+        for k in self.key_schedule:
+            # uint32 arithmetic wraps around, so no masking is needed
+            f = ((x << 1) | (x >> 31)) & ((x << 8) | (x >> 24))
+            f ^= (x << 2) | (x >> 30)
+            f ^= y
+            f ^= np.uint32(k)
+            x, y = f, x
+            
+        return x, y
+
 # --- SPECK CIPHER LOGIC (64/128 configuration) ---
 class SpeckCipherEngine:
     def __init__(self, key):
@@ -67,4 +109,39 @@ class SpeckCipherEngine:
             rol3 = ((y << 3) | (y >> (self.word_size - 3))) & self.mask
             y = rol3 ^ x
 
-        return (x << self.word_size) | y
\ No newline at end of file
+        return (x << self.word_size) | y
+
+    def encrypt_batch(self, x, y):
+        """
+        Vectorized encrypt: x and y are uint32 arrays holding the high and
+        low words of every block. Each round runs across the whole batch.
+        """
+        x = np.array(x, dtype=np.uint32)
+        y = np.array(y, dtype=np.uint32)
+        
+        for k in self.key_schedule:
+            # Rotate Right 8, add (mod 2^32) and mix in the round key
+            x = (x >> 8) | (x << 24)
+            x += y
+            x ^= np.uint32(k)
+            
+            # Rotate Left 3
+            y = (y << 3) | (y >> 29)
+            y ^= x
+
+        return x, y
+
+
+# --- KEY SCHEDULE CACHE ---
+# Expanding a key is the expensive part of a single-block encryption, so the
+# engines (which only hold the expanded schedule) are shared across wrappers.
+
+@lru_cache(maxsize=KEY_SCHEDULE_CACHE_SIZE)
+def get_simon_engine(key):
+    """Returns a SimonCipherEngine for 'key' (bytes), reusing cached key schedules"""
+    return SimonCipherEngine(key)
+
+@lru_cache(maxsize=KEY_SCHEDULE_CACHE_SIZE)
+def get_speck_engine(key):
+    """Returns a SpeckCipherEngine for 'key' (bytes), reusing cached key schedules"""
+    return SpeckCipherEngine(key)
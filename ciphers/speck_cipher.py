@@ -1,15 +1,20 @@
-from core.interfaces import BaseCipher
+from core.interfaces import BaseCipher, to_block_array
 # Import from your LOCAL file now
-from ciphers.simon_speck_logic import SpeckCipherEngine
+from ciphers.simon_speck_logic import SpeckCipherEngine, get_speck_engine, split_words, join_words
 
 class SpeckCipher(BaseCipher):
     @property
     def name(self):
         return "Speck-64/128 (Software Optimized)"
 
+    def expand_key(self, key):
+        # Uncached key setup (used by the benchmark to time the key schedule on its own)
+        clean_key = key.ljust(16, b'\0')[:16]
+        return SpeckCipherEngine(clean_key)
+
     def encrypt(self, plaintext, key):
         clean_key = key.ljust(16, b'\0')[:16]
-        engine = SpeckCipherEngine(clean_key)
+        engine = get_speck_engine(bytes(clean_key))
         
         pt_padded = plaintext.ljust(8, b'\0')[:8]
         pt_int = int.from_bytes(pt_padded, 'big')
@@ -18,5 +23,14 @@ class SpeckCipher(BaseCipher):
         
         return ct_int.to_bytes(8, 'big')
 
+    def encrypt_batch(self, blocks, key):
+        clean_key = key.ljust(16, b'\0')[:16]
+        engine = get_speck_engine(bytes(clean_key))
+        
+        x, y = split_words(to_block_array(blocks, self.block_size))
+        x, y = engine.encrypt_batch(x, y)
+        
+        return join_words(x, y)
+
     def decrypt(self, ciphertext, key):
         return ciphertext
\ No newline at end of file
@@ -1,4 +1,6 @@
-from core.interfaces import BaseCipher
+import numpy as np
+
+from core.interfaces import BaseCipher, to_block_array
 
 class SimpleXORCipher(BaseCipher):
     @property
@@ -9,5 +11,11 @@ class SimpleXORCipher(BaseCipher):
         # A very weak cipher just for testing the pipeline
         return bytes([p ^ k for p, k in zip(plaintext, key)])
 
+    def encrypt_batch(self, blocks, key):
+        # zip() stops at the shorter of the block and the key
+        blocks = to_block_array(blocks, self.block_size)
+        width = min(blocks.shape[1], len(key))
+        return blocks[:, :width] ^ np.frombuffer(key[:width], dtype=np.uint8)
+
     def decrypt(self, ciphertext, key):
         return self.encrypt(ciphertext, key)
\ No newline at end of file
@@ -0,0 +1,2 @@
+# core/__init__.py
+__version__ = "0.1.0"
@@ -1,51 +1,231 @@
-import sys
-import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-# --- PATH FIX ---
-current_dir = os.path.dirname(os.path.abspath(__file__))
-lib_path = os.path.join(current_dir, 'differential_cryptanalysis_lib')
-if lib_path not in sys.path:
-    sys.path.append(lib_path)
+import numpy as np
 
-# Try importing the attack library safely
-try:
-    from differential_cryptanalysis_lib import analize_cipher
-except ImportError:
-    analize_cipher = None
+# The attack library is imported safely there (None when it can not be found)
+from core.attacks import DifferentialAnalyzer, spn_differential_attack, scan_differentials, SCAN_ALPHA
+from core.metrics import (avalanche_partial_sums, measure_performance, measure_key_setup,
+                          merge_avalanche_sums, avalanche_score, avalanche_interval,
+                          calculate_sac_matrix, calculate_bic)
+from core.parallel import make_cipher_spec, build_cipher, submit_avalanche_shards, default_workers
+from core.benchmark import run_benchmark
+from core.randomness import calculate_randomness
 
-from core.metrics import calculate_avalanche_effect, measure_performance
+# Fixed key used by every audit (the metrics compare ciphers, not keys)
+AUDIT_KEY = b'0123456789abcdef'
+
+# Message sizes used for the benchmark sweep during an audit
+AUDIT_MESSAGE_SIZES = (16, 256, 4096, 65536)
+
+# Default budget of the differential attack stage (wall-clock seconds, MB)
+ATTACK_TIME_BUDGET = 10.0
+ATTACK_MEMORY_MB = 256
 
 class CipherAuditAgent:
     # ---------------------------------------------------------
     # ERROR WAS HERE: We must accept 'cipher_instance' in __init__
     # ---------------------------------------------------------
-    def __init__(self, cipher_instance):
+    def __init__(self, cipher_instance, progress_callback=None):
         self.cipher = cipher_instance
         self.results = {}
+        # Called with small dicts ({'stage': ..., ...}) as the audit goes on.
+        # Avalanche progress is reported once per batch, so the hot loop stays cheap.
+        self.progress_callback = progress_callback
+
+    def _emit(self, stage, **data):
+        if self.progress_callback is not None:
+            self.progress_callback({'stage': stage, **data})
+
+    def _avalanche_progress(self, rounds_total):
+        if self.progress_callback is None:
+            return None
 
-    def run_full_audit(self, rounds=1000):
+        def on_batch(sums):
+            low, high = avalanche_interval(sums)
+            self._emit('avalanche', rounds_completed=sums['rounds'], rounds_total=rounds_total,
+                       avalanche_estimate=avalanche_score(sums), ci_low=low, ci_high=high)
+        return on_batch
+
+    def run_full_audit(self, rounds=1000, parallel=False, workers=None, seed=None, tolerance=None,
+                       sac_samples=None, attack_time_budget=ATTACK_TIME_BUDGET,
+                       attack_memory_mb=ATTACK_MEMORY_MB, scan_pairs=None, randomness_bytes=None,
+                       bic_samples=None):
         print(f"🕵️ Agent: Starting audit for {self.cipher.name}...")
         
         # 1. Security Test (Avalanche)
         # using a dummy key for testing metrics
-        dummy_key = b'0123456789abcdef' 
+        dummy_key = AUDIT_KEY
+        stages = self._independent_stages(seed, sac_samples, attack_time_budget, attack_memory_mb, scan_pairs,
+                                          randomness_bytes, bic_samples)
         
-        # Pass 'rounds' to the metric function
-        av_score = calculate_avalanche_effect(self.cipher, dummy_key, rounds=rounds)
-        self.results['Avalanche Score'] = f"{av_score:.2f}%"
+        # With a 'tolerance' (± percentage points) the avalanche test stops as soon
+        # as it has converged, and 'rounds' is only an upper bound
+        if parallel:
+            # Avalanche shards and the other independent stages share a process pool
+            sums, stage_results = self._run_parallel_stages(dummy_key, rounds, workers, seed, tolerance, stages)
+        else:
+            # Pass 'rounds' to the metric function
+            self._emit('avalanche', rounds_completed=0, rounds_total=rounds)
+            sums = avalanche_partial_sums(self.cipher, dummy_key, rounds, seed=seed,
+                                          on_batch=self._avalanche_progress(rounds), tolerance=tolerance)
+            stage_results = {}
+            for stage, (method, args) in stages.items():
+                self._emit(stage)
+                stage_results[stage] = getattr(self, method)(*args)
+        self.results['Avalanche Score'] = f"{avalanche_score(sums):.2f}%"
+        self.results['Avalanche Samples'] = sums['rounds']
+        if tolerance:
+            low, high = avalanche_interval(sums)
+            self.results['Avalanche 95% CI'] = f"{low:.2f}% - {high:.2f}%"
+
+        # Bit Independence Criterion, next to the avalanche score (optional, see run_bic_stage)
+        if 'bic' in stage_results:
+            self.results['BIC Score'] = f"{stage_results['bic']['max_correlation']:.4f}"
+            self.results['BIC'] = stage_results['bic']
+
+        # Strict Avalanche Criterion matrix (optional, see run_sac_stage)
+        if 'sac' in stage_results:
+            self.results['SAC'] = stage_results['sac']
+
+        # Output-difference distribution per input difference (optional, see run_differential_scan_stage)
+        if 'differential_scan' in stage_results:
+            self.results['Differential Scan'] = stage_results['differential_scan']
+
+        # NIST SP 800-22 style tests over counter-mode output (optional, see run_randomness_stage)
+        if 'randomness' in stage_results:
+            self.results['Randomness'] = stage_results['randomness']
 
         # 2. Performance Test
+        # Always runs on its own (after any worker pool is gone) so timings stay clean
+        self.run_performance_stage(dummy_key)
+        
+        # 3. Differential Attack (key recovery on SPN ciphers, within its budget)
+        attack = stage_results['attack']
+        self.results['Attack Status'] = attack['status']
+        if len(attack) > 1:
+            self.results['Differential Attack'] = {k: v for k, v in attack.items() if k != 'status'}
+
+        self._emit('done')
+        return self.results
+
+    def _independent_stages(self, seed, sac_samples, attack_time_budget=ATTACK_TIME_BUDGET,
+                            attack_memory_mb=ATTACK_MEMORY_MB, scan_pairs=None, randomness_bytes=None,
+                            bic_samples=None):
+        # Stages that do not depend on each other: name -> (method, args)
+        stages = {}
+        if sac_samples:
+            stages['sac'] = ('run_sac_stage', (sac_samples, seed))
+        if bic_samples:
+            stages['bic'] = ('run_bic_stage', (bic_samples, seed))
+        if scan_pairs:
+            stages['differential_scan'] = ('run_differential_scan_stage', (scan_pairs, seed))
+        if randomness_bytes:
+            stages['randomness'] = ('run_randomness_stage', (randomness_bytes,))
+        stages['attack'] = ('run_attack_stage', (attack_time_budget, attack_memory_mb, seed))
+        return stages
+
+    def run_sac_stage(self, samples, seed=None, key=AUDIT_KEY):
+        sac = calculate_sac_matrix(self.cipher, key, samples=samples, seed=seed)
+        # JSON-friendly version of the result (the matrix feeds the heatmap)
+        return {
+            'samples': sac['samples'],
+            'input_bits': sac['input_bits'],
+            'output_bits': sac['output_bits'],
+            'max_deviation': round(sac['max_deviation'], 4),
+            'worst_pair': list(sac['worst_pair']),
+            'chi_square': round(sac['chi_square'], 2),
+            'degrees_of_freedom': sac['degrees_of_freedom'],
+            'p_value': sac['p_value'],
+            'matrix': np.round(sac['matrix'], 4).tolist(),
+        }
+
+    def run_bic_stage(self, samples, seed=None, key=AUDIT_KEY):
+        bic = calculate_bic(self.cipher, key, samples=samples, seed=seed)
+        return {**bic,
+                'max_correlation': round(bic['max_correlation'], 4),
+                'mean_correlation': round(bic['mean_correlation'], 4),
+                'worst_pair': list(bic['worst_pair'])}
+
+    def run_differential_scan_stage(self, pairs, seed=None, key=AUDIT_KEY, top=3):
+        scan = scan_differentials(self.cipher, key, pairs=pairs, top=top, seed=seed)
+        # A differential is significant below SCAN_ALPHA split over the input differences
+        threshold = SCAN_ALPHA / len(scan)
+        worst = min(scan, key=lambda entry: entry['top'][0]['p_value'])
+        return {
+            'pairs_per_difference': pairs,
+            'input_differences': len(scan),
+            'significant': sum(entry['top'][0]['p_value'] < threshold for entry in scan),
+            'worst': {'input_difference': worst['input_difference'], **worst['top'][0]},
+            'differentials': scan,
+        }
+
+    def run_randomness_stage(self, total_bytes, key=AUDIT_KEY):
+        return calculate_randomness(self.cipher, key, total_bytes)
+
+    def run_performance_stage(self, key=AUDIT_KEY):
+        self._emit('performance')
         dummy_data = b'Hello World Data'
-        speed, mem = measure_performance(self.cipher, dummy_data, dummy_key)
+        speed, mem = measure_performance(self.cipher, dummy_data, key)
         self.results['Encryption Speed (ms)'] = f"{speed:.4f} ms"
         self.results['Peak Memory (KB)'] = f"{mem:.2f} KB"
-        
-        # 3. Attack Simulation (The Bonus Feature)
-        if analize_cipher:
-            # Here we would normally call analize_cipher()
-            # For the demo, we mark it as "SAFE" if no obvious flaw is found
-            self.results['Attack Status'] = "SAFE (Simulation Passed)"
+
+        # Key schedule cost is reported separately from the per-block speed
+        key_setup = measure_key_setup(self.cipher, key)
+        if key_setup is not None:
+            self.results['Key Setup (ms)'] = f"{key_setup:.4f} ms"
+
+        # Structured numbers (median/p95/stddev, ns/byte, cycles/byte) per message size
+        self.results['Benchmark'] = run_benchmark(self.cipher, key, sizes=AUDIT_MESSAGE_SIZES,
+                                                  max_seconds_per_size=1.0)
+
+    def run_attack_stage(self, time_budget=ATTACK_TIME_BUDGET, memory_mb=ATTACK_MEMORY_MB, seed=None,
+                         key=AUDIT_KEY):
+        # Only ciphers that describe their SPN structure can be attacked
+        if DifferentialAnalyzer is None:
+            return {'status': "Skipped (Lib not found)"}
+        if getattr(self.cipher, 'spn', None) is None:
+            return {'status': "Skipped (No SPN description)"}
+
+        attack = spn_differential_attack(self.cipher, key, time_budget=time_budget,
+                                         memory_budget_mb=memory_mb, seed=seed)
+        if attack['key_recovered']:
+            status = f"BROKEN ({attack['key_bits']} key bits recovered)"
+        elif not attack['complete']:
+            status = f"PARTIAL ({attack['stopped_by']} budget exhausted)"
+        elif attack['best_probability'] is None:
+            status = "SAFE (No usable characteristic)"
         else:
-            self.results['Attack Status'] = "Skipped (Lib not found)"
+            status = "SAFE (Key not recovered)"
+        return {'status': status, **attack}
+
+    def _run_parallel_stages(self, key, rounds, workers, seed, tolerance, stages):
+        workers = workers or default_workers()
+        # Ciphers pasted as code are rebuilt from their source inside the workers
+        spec = make_cipher_spec(self.cipher)
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            stage_futures = {stage: executor.submit(_stage_worker, spec, method, args)
+                             for stage, (method, args) in stages.items()}
+            shard_futures = submit_avalanche_shards(executor, spec, key, rounds, workers, seed, tolerance)
+
+            # Merge the shards as they come in (reported as partial results)
+            self._emit('avalanche', rounds_completed=0, rounds_total=rounds)
+            on_shard = self._avalanche_progress(rounds)
+            parts = []
+            for future in as_completed(shard_futures):
+                parts.append(future.result())
+                if on_shard is not None:
+                    on_shard(merge_avalanche_sums(parts))
+            sums = merge_avalanche_sums(parts)
+
+            stage_results = {}
+            for stage, future in stage_futures.items():
+                self._emit(stage)
+                stage_results[stage] = future.result()
+
+        return sums, stage_results
+
 
-        return self.results
\ No newline at end of file
+def _stage_worker(spec, method, args):
+    # Runs one independent audit stage in a worker process
+    return getattr(CipherAuditAgent(build_cipher(spec)), method)(*args)
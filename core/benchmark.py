@@ -0,0 +1,166 @@
+# core/benchmark.py
+import gc
+import os
+import statistics
+import time
+import tracemalloc
+
+import numpy as np
+
+from core.interfaces import to_block_array
+
+# Message sizes swept by default (16 B up to 1 MiB)
+DEFAULT_MESSAGE_SIZES = (16, 64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# A single timed trial should last at least this long (short calls get repeated inside it)
+MIN_TRIAL_NS = 1_000_000
+
+
+def estimate_cpu_hz():
+    """
+    Best-effort guess of the CPU clock (Hz), used for the cycles/byte estimate.
+    Returns None when the platform does not tell us.
+    """
+    try:
+        with open('/proc/cpuinfo', encoding='utf-8') as f:
+            mhz = [float(line.split(':')[1]) for line in f if line.lower().startswith('cpu mhz')]
+        if mhz:
+            return max(mhz) * 1e6
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def make_message_encryptor(cipher, key, message):
+    """
+    Returns a zero-argument callable that encrypts 'message' once.
+    Block ciphers get the message as a batch of blocks (zero padded to a full
+    block); ciphers with block_size = None (AEAD/stream) take it in one call.
+    """
+    block_size = getattr(cipher, 'block_size', 8)
+    if not block_size:
+        return lambda: cipher.encrypt(message, key)
+
+    padded = message.ljust(-(-len(message) // block_size) * block_size, b'\0')
+    blocks = to_block_array(padded, block_size)
+
+    encrypt_batch = getattr(cipher, 'encrypt_batch', None)
+    if encrypt_batch is not None:
+        return lambda: encrypt_batch(blocks, key)
+
+    chunks = [padded[i:i + block_size] for i in range(0, len(padded), block_size)]
+    return lambda: [cipher.encrypt(chunk, key) for chunk in chunks]
+
+
+def summarize_samples(samples_ns):
+    """Median / p95 / stddev (and friends) of a list of per-call timings in ns"""
+    return {
+        'trials': len(samples_ns),
+        'min_ns': float(min(samples_ns)),
+        'mean_ns': float(statistics.fmean(samples_ns)),
+        'median_ns': float(statistics.median(samples_ns)),
+        'p95_ns': float(np.percentile(samples_ns, 95)),
+        'stddev_ns': float(statistics.stdev(samples_ns)) if len(samples_ns) > 1 else 0.0,
+    }
+
+
+def time_callable(func, trials=15, warmup=3, max_seconds=2.0):
+    """
+    Timing pass: runs 'func' a few times to warm up, then measures 'trials'
+    repetitions with perf_counter_ns (no tracing active).
+    Fast calls are repeated inside each trial so a trial lasts >= MIN_TRIAL_NS.
+    The warm-up calls and every trial check a max_seconds deadline, so slow
+    calls report fewer trials (at worst only the calibration call).
+    Returns the list of per-call timings in ns.
+    """
+    deadline = time.perf_counter_ns() + int(max_seconds * 1e9)
+
+    # First warm-up call also calibrates the trial length
+    start = time.perf_counter_ns()
+    func()
+    first_ns = max(time.perf_counter_ns() - start, 1)
+
+    inner = max(1, MIN_TRIAL_NS // first_ns)
+
+    for _ in range(warmup - 1):
+        # Keep room for at least one measured trial
+        if time.perf_counter_ns() + first_ns * (1 + inner) > deadline:
+            break
+        func()
+
+    samples = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(trials):
+            now = time.perf_counter_ns()
+            if now >= deadline or (samples and now + first_ns * inner > deadline):
+                break
+            start = time.perf_counter_ns()
+            for _ in range(inner):
+                func()
+            samples.append((time.perf_counter_ns() - start) / inner)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return samples or [float(first_ns)]
+
+
+def measure_peak_memory(func):
+    """Memory pass: peak traced allocation (KB) of a single call, timed separately"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024
+
+
+def benchmark_key_setup(cipher, key, trials=15, warmup=3):
+    """Timing summary of the cipher's 'expand_key' step, or None if it has none"""
+    expand_key = getattr(cipher, 'expand_key', None)
+    if expand_key is None:
+        return None
+    return summarize_samples(time_callable(lambda: expand_key(key), trials, warmup))
+
+
+def run_benchmark(cipher, key, sizes=DEFAULT_MESSAGE_SIZES, trials=15, warmup=3,
+                  max_seconds_per_size=2.0, cpu_hz=None, seed=None):
+    """
+    Benchmarks 'cipher' over a sweep of message sizes.
+    Timing and memory are measured in separate passes. Returns a dict:
+        {'cipher', 'cpu_hz', 'key_setup': {...} or None,
+         'sizes': [{'size', 'median_ns', 'p95_ns', 'stddev_ns', 'ns_per_byte',
+                    'cycles_per_byte', 'mb_per_s', 'peak_memory_kb', ...}, ...]}
+    """
+    if cpu_hz is None:
+        cpu_hz = estimate_cpu_hz()
+
+    rng = np.random.default_rng(seed)
+
+    results = {
+        'cipher': cipher.name,
+        'cpu_hz': cpu_hz,
+        'key_setup': benchmark_key_setup(cipher, key, trials, warmup),
+        'sizes': [],
+    }
+
+    for size in sizes:
+        message = rng.integers(0, 256, size=size, dtype=np.uint8).tobytes()
+        encrypt_message = make_message_encryptor(cipher, key, message)
+
+        # 1. Timing pass
+        stats = summarize_samples(time_callable(encrypt_message, trials, warmup, max_seconds_per_size))
+
+        # 2. Memory pass
+        stats['peak_memory_kb'] = measure_peak_memory(encrypt_message)
+
+        stats['size'] = size
+        stats['ns_per_byte'] = stats['median_ns'] / size
+        stats['cycles_per_byte'] = stats['ns_per_byte'] * cpu_hz / 1e9 if cpu_hz else None
+        stats['mb_per_s'] = size / stats['median_ns'] * 1e3
+        results['sizes'].append(stats)
+
+    return results
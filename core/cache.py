@@ -0,0 +1,224 @@
+# core/cache.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from core import __version__
+
+DEFAULT_CACHE_DIR = os.environ.get("CIPHERSCORE_CACHE_DIR",
+                                   os.path.join(os.path.expanduser("~"), ".cache", "cipherscore"))
+
+# Report entries that depend on the machine (and load) rather than on the cipher
+TIMING_KEYS = ('Encryption Speed (ms)', 'Peak Memory (KB)', 'Key Setup (ms)', 'Benchmark')
+
+# The same, inside report sections: section -> its timing fields
+TIMING_FIELDS = {'Differential Attack': ('time_spent',)}
+
+
+def audit_cache_key(cipher_id, custom_code=None, **params):
+    """
+    Cache key of an audit: the cipher id (or the SHA-256 of the pasted code),
+    the audit parameters (rounds, seed, ...) and the library version.
+    """
+    if custom_code is not None:
+        cipher_id = "custom:" + hashlib.sha256(custom_code.encode('utf-8')).hexdigest()
+    material = {'cipher': cipher_id, 'version': __version__, 'params': params}
+    return hashlib.sha256(json.dumps(material, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def split_report(report):
+    """Splits a report into its deterministic part and its timing part"""
+    results = {k: v for k, v in report.items() if k not in TIMING_KEYS}
+    timing = {k: v for k, v in report.items() if k in TIMING_KEYS}
+    for section, fields in TIMING_FIELDS.items():
+        if isinstance(results.get(section), dict):
+            values = results[section]
+            results[section] = {k: v for k, v in values.items() if k not in fields}
+            section_timing = {k: v for k, v in values.items() if k in fields}
+            if section_timing:
+                timing[section] = section_timing
+    return results, timing
+
+
+def join_report(results, timing):
+    """Puts a report split by split_report back together"""
+    report = dict(results)
+    for k, v in timing.items():
+        report[k] = {**report.get(k, {}), **v} if k in TIMING_FIELDS else v
+    return report
+
+
+def is_cacheable(report):
+    """
+    False for reports whose results depend on how fast the machine was:
+    an attack cut by its time or memory budget would be served forever.
+    """
+    return not report.get('Differential Attack', {}).get('stopped_by')
+
+
+def cached_full_audit(cache, cache_key, agent, **audit_kwargs):
+    """
+    Runs agent.run_full_audit(**audit_kwargs) through 'cache'.
+    A full hit returns the stored report; a hit with expired timings only
+    re-runs the performance stage; a miss runs (and stores) the full audit,
+    unless is_cacheable() rejects the report.
+    """
+    entry = cache.get(cache_key)
+    if entry is not None and entry['timing'] is not None:
+        return join_report(entry['results'], entry['timing'])
+
+    if entry is not None:
+        # Only the performance stage is re-measured: section timings (the attack's
+        # time_spent) are carried over from the expired entry
+        expired = entry.get('expired_timing') or {}
+        agent.results = join_report(entry['results'], {k: v for k, v in expired.items() if k in TIMING_FIELDS})
+        agent.run_performance_stage()
+        cache.put_timing(cache_key, split_report(agent.results)[1])
+        return agent.results
+
+    report = agent.run_full_audit(**audit_kwargs)
+    if is_cacheable(report):
+        cache.put(cache_key, report)
+    return report
+
+
+class AuditResultCache:
+    """
+    Two-tier cache of audit reports: an in-memory LRU in front of a SQLite
+    file that survives restarts. Disk entries are evicted by age and by total
+    size. Timing entries have their own (shorter) TTL because they depend on
+    the machine; a hit with stale timings returns them as None.
+    """
+
+    def __init__(self, path=None, memory_entries=256, max_disk_bytes=64 * 1024 * 1024,
+                 max_age=30 * 24 * 3600, timing_ttl=3600):
+        self.path = path or os.path.join(DEFAULT_CACHE_DIR, "audits.sqlite3")
+        self.memory_entries = memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.max_age = max_age
+        self.timing_ttl = timing_ttl
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._connect() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS audits (
+                              key TEXT PRIMARY KEY,
+                              results TEXT NOT NULL,
+                              timing TEXT,
+                              created REAL NOT NULL,
+                              timing_created REAL,
+                              accessed REAL NOT NULL,
+                              size INTEGER NOT NULL)""")
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10)
+        try:
+            with db:  # commits (or rolls back) the transaction
+                yield db
+        finally:
+            db.close()
+
+    def get(self, key):
+        """
+        Returns {'results': {...}, 'timing': {...} or None} or None on a miss.
+        When the timings have expired, 'timing' is None and 'expired_timing'
+        holds them (e.g. to keep the ones that are not re-measured).
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+
+        if entry is None:
+            with self._connect() as db:
+                row = db.execute("SELECT results, timing, created, timing_created FROM audits WHERE key = ?",
+                                 (key,)).fetchone()
+                if row is None:
+                    return None
+                db.execute("UPDATE audits SET accessed = ? WHERE key = ?", (now, key))
+            entry = {
+                'results': json.loads(row[0]),
+                'timing': json.loads(row[1]) if row[1] else None,
+                'created': row[2],
+                'timing_created': row[3],
+            }
+            self._remember(key, entry)
+
+        if now - entry['created'] > self.max_age:
+            self.delete(key)
+            return None
+
+        timing = entry['timing']
+        if timing is not None and now - entry['timing_created'] > self.timing_ttl:
+            return {'results': entry['results'], 'timing': None, 'expired_timing': timing}
+        return {'results': entry['results'], 'timing': timing}
+
+    def put(self, key, report):
+        """Stores a full report (timing keys are split off automatically)"""
+        results, timing = split_report(report)
+        self._store(key, results, timing)
+
+    def put_timing(self, key, timing):
+        """Refreshes only the timing part of an existing entry"""
+        if self.get(key) is None:
+            return
+        # get() loaded the entry into the memory tier; keep its original age
+        with self._lock:
+            entry = self._memory.get(key)
+        if entry is None:
+            return
+        self._store(key, entry['results'], timing, created=entry['created'])
+
+    def _store(self, key, results, timing, created=None):
+        now = time.time()
+        created = created or now
+        entry = {'results': results, 'timing': timing or None, 'created': created, 'timing_created': now}
+        self._remember(key, entry)
+
+        results_json = json.dumps(results)
+        timing_json = json.dumps(timing) if timing else None
+        size = len(results_json) + len(timing_json or '')
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO audits VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       (key, results_json, timing_json, created, now, now, size))
+            self._evict(db, now)
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _evict(self, db, now):
+        # 1. By age
+        db.execute("DELETE FROM audits WHERE created < ?", (now - self.max_age,))
+        # 2. By size (least recently used first)
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM audits").fetchone()[0]
+        if total > self.max_disk_bytes:
+            for key, size in db.execute("SELECT key, size FROM audits ORDER BY accessed").fetchall():
+                db.execute("DELETE FROM audits WHERE key = ?", (key,))
+                total -= size
+                if total <= self.max_disk_bytes:
+                    break
+
+    def delete(self, key):
+        with self._lock:
+            self._memory.pop(key, None)
+        with self._connect() as db:
+            db.execute("DELETE FROM audits WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        with self._connect() as db:
+            db.execute("DELETE FROM audits")
@@ -12,6 +12,14 @@
 
 import random
 import hashlib
+import os
+import sys
+
+# The P-box table compiler is core/spn.py's (the repository root has to be importable)
+repo_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if repo_root not in sys.path:
+    sys.path.append(repo_root)
+from core.spn import make_bit_tables
 
 blockSize = 16
 verboseState = False
@@ -32,6 +40,18 @@ def apply_sbox(state, sbox):
 pbox = {0:0, 1:4, 2:8, 3:12, 4:1, 5:5, 6:9, 7:13, 8:2, 9:6, 10:10, 11:14, 12:3, 13:7, 14:11, 15:15}
 pbox_inv = {0:0, 4:1, 8:2, 12:3, 1:4, 5:5, 9:6, 13:7, 2:8, 6:9, 10:10, 14:11, 3:12, 7:13, 11:14, 15:15}
 
+# Permute a state with the tables of make_bit_tables, one lookup per byte
+def apply_pbox(state, tables):
+    result = 0
+    for table in tables:
+        result |= table[state & 0xff]
+        state >>= 8
+    return result
+
+# Compiled to one 256 entry table per byte of the state (as Python ints)
+pbox_tables = make_bit_tables(pbox, blockSize).tolist()
+pbox_inv_tables = make_bit_tables(pbox_inv, blockSize).tolist()
+
 # (3) Key mixing: bitwise XOR between round subkey and data block input to round
 # Key schedule: independant random round keys.
 # We take the sha-hash of a 128-bit 'random' seed and then take the first 80-bits
@@ -60,11 +80,7 @@ def encrypt(pt, k):
         if verboseState: print (hex(state), end = ' ')
         
         #Permute the state bitwise (2)
-        state_temp = 0      
-        for bitIdx in range(0,blockSize):
-            if(state & (1 << bitIdx)):
-                state_temp |= (1 << pbox[bitIdx])
-        state = state_temp
+        state = apply_pbox(state, pbox_tables)
         if verboseState: print (hex(state))
     
     # Final round of SPN cipher (k4, sbox, s5)
@@ -105,11 +121,7 @@ def decrypt(ct, k):
         if verboseState: print (hex(state), end=' ')
         
         #Un-permute the state bitwise (2)
-        state_temp = 0      
-        for bitIdx in range(0, blockSize):
-            if(state & (1 << bitIdx)):
-                state_temp |= (1 << pbox[bitIdx])
-        state = state_temp
+        state = apply_pbox(state, pbox_inv_tables)
         if verboseState: print (hex(state), end = ' ')
         
         #Apply inverse s-box
@@ -0,0 +1,99 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from basic_SPN import *
+import linear_cryptanalysis_lib as lc_lib
+import random
+
+# modify accordingly
+def do_sbox(number):
+    return sbox[number]
+
+# modify accordingly
+def do_inv_sbox(number):
+    return sbox_inv[number]
+
+# modify accordingly
+def do_pbox(state):
+    return apply_pbox(state, pbox_tables)
+
+def main():
+
+    NUM_P_C_PAIRS = 20000
+    SBOX_BITS  = 4
+    NUM_SBOXES = 4
+    NUM_ROUNDS = 4
+    MIN_BIAS = 1 / 64
+    MAX_BLOCKS_TO_BF = 2
+
+    lc_lib.initialize(NUM_P_C_PAIRS,
+                      SBOX_BITS,
+                      NUM_SBOXES,
+                      NUM_ROUNDS,
+                      MIN_BIAS,
+                      MAX_BLOCKS_TO_BF,
+                      do_sbox,
+                      do_inv_sbox,
+                      do_pbox)
+
+    print('analizing cipher...')
+    linear_approximations = lc_lib.analize_cipher(top_k=10)
+    if len(linear_approximations) == 0:
+        exit('no linear approximation could be found!')
+
+    print('\nbest linear approximations:')
+    for linear_approximation in linear_approximations:
+        print(linear_approximation)
+
+    print('\nthe linear approximation with the best bias will be used')
+    # you may choose anyone you like
+    linear_approximation = linear_approximations[0]
+
+    # this will be different with another cipher
+    key = keyGeneration()
+    k_int = int(key, 16)
+
+    # find which key bits we should obtain
+    key_to_find = 0
+    for block_num in linear_approximation[2]:
+        k = k_int >> ((NUM_SBOXES - (block_num-1) - 1) * SBOX_BITS)
+        k = k & ((1 << SBOX_BITS) - 1)
+        key_to_find = (key_to_find << SBOX_BITS) | k
+
+    # generate the known-plaintexts and their ciphertexts
+    # the 'encrypt' function might be different for you
+    p_c_pairs = []
+    for _ in range(NUM_P_C_PAIRS):
+        p = random.getrandbits(16)
+        p_c_pairs.append( [p, encrypt(p, key)] )
+
+    print('\nbreaking cipher...\n')
+
+    # obtain the bias of each key given the pairs and the linear approximation
+    biases = lc_lib.get_key_biases(p_c_pairs, linear_approximation)
+
+    # get the key with the highest bias
+    maxResult, maxIdx = 0, 0
+    for rIdx, result in enumerate(biases):
+        if result > maxResult:
+            maxResult = result
+            maxIdx    = rIdx
+
+    if maxIdx == key_to_find:
+        print('Success!')
+        bits_found = '{:b}'.format(maxIdx).zfill(len(linear_approximation[2])*SBOX_BITS)
+        bits_found = [bits_found[i:i+SBOX_BITS] for i in range(0, len(bits_found), SBOX_BITS)]
+
+        blocks_num = list(linear_approximation[2].keys())
+
+        zipped = list(zip(blocks_num, bits_found))
+
+        print('\nobtained key bits:')
+        for num_block, bits in zipped:
+            print('block {:d}: {}'.format(num_block, bits))
+
+    else:
+        print('Failure')
+
+if __name__ == "__main__":
+    main()
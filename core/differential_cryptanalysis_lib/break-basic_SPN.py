@@ -15,12 +15,7 @@ def do_inv_sbox(number):
 
 # modify accordingly
 def do_pbox(state):
-    state_temp = 0
-    for bitIdx in range(0,16):
-        if(state & (1 << bitIdx)):
-            state_temp |= (1 << pbox[bitIdx])
-    state = state_temp
-    return state
+    return apply_pbox(state, pbox_tables)
 
 def main():
 
@@ -2,412 +2,799 @@
 # -*- coding: utf-8 -*-
 
 from math import fabs, ceil
+from collections import namedtuple
+from itertools import count, product
+import hashlib
+import heapq
+import json
 import multiprocessing
 import concurrent.futures
+import os
+import sys
+import time
 
-from basic_SPN import *
-
-initialized = False
-
-# I know this is ugly
-def initialize(num_p_c_pairs, sbox_bits , num_sboxes, num_rounds, min_prob, max_blocks_to_bf, do_sbox_param, do_inv_sbox_param, do_pbox_param):
-    global NUM_C_PAIRS, SBOX_BITS , NUM_SBOXES, NUM_ROUNDS, MIN_PROB, MAX_BLOCKS_TO_BF, do_sbox, do_inv_sbox, do_pbox, initialized
-    NUM_C_PAIRS = num_p_c_pairs
-    SBOX_BITS = sbox_bits
-    NUM_SBOXES = num_sboxes
-    NUM_ROUNDS = num_rounds
-    MIN_PROB = min_prob
-    MAX_BLOCKS_TO_BF = max_blocks_to_bf
-    do_sbox = do_sbox_param
-    do_inv_sbox = do_inv_sbox_param
-    do_pbox = do_pbox_param
-    initialized = True
-
-def apply_mask(value, mask):
-    #retrieve the parity of mask/value
-    interValue = value & mask
-    total = 0
-    while interValue > 0:
-        temp = interValue & 1
-        interValue = interValue >> 1
-        if temp == 1:
-            total = total ^ 1
-    return total
+import numpy as np
 
-def create_diff_table():
-    # Calculate the maximum value / differential
-    ssize = 1 << SBOX_BITS
-    # Generate the matrix of differences, starting
-    # at all zeros
-    table = []
-    for i in range(ssize):
-        table.append([0 for j in range(ssize)])
-    # Take every possible value for the first plaintext
-    for x1 in range(0, ssize):
-        # Calculate the corresponding ciphertext
-        y1 = do_sbox(x1)
-        # Now, for each possible differential
-        for dx in range(1, ssize):
-            # Calculate the other plaintext and ciphertext
-            x2 = x1 ^ dx
-            y2 = do_sbox(x2)
-            # Calculate the output differential
-            dy = y1 ^ y2
-            # Increment the count of the characteristic
-            # in the table corresponding to the two
-            # differentials
-            table[dx][dy] += 1
-
-    return table
-
-# only keeps the dx and dy pairs that have more than zero hits
-def reduce_table(table):
-    ssize = 1 << SBOX_BITS
-
-    new_table = []
-    for dx in range(ssize):
-        for dy in range(ssize):
-            prob = (table[dx][dy]/ssize) * 100
-            if prob >= MIN_PROB:
-                new_table.append( [dx, dy, table[dx][dy]/ssize] )
+# the pbox table compiler is core/spn.py's, so the repository root has to be importable
+# from wherever this library is loaded
+repo_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if repo_root not in sys.path:
+    sys.path.append(repo_root)
+from core.spn import make_bit_tables
 
-    # each element consist in dx, dy and the probability
-    return new_table
-
-# from an sbox and the "output" of a bias y,
-# calculate which sboxs will be reached and in which bits
-def get_destination(num_sbox, y):
-    # pass 'y' through the permutation
-    offset = (NUM_SBOXES - (num_sbox-1) - 1) * SBOX_BITS
-    Y = y << offset
-    # do_pbox is supposed to transpose the state, make sure is well defined!
-    permuted = do_pbox(Y)
-
-    sboxes_reached = {}
-    # sboxes go from 1 to NUM_SBOXES from left to right
-    # bits go from 1 to SBOX_BITS from left to right
-    for sbox in range(1, NUM_SBOXES + 1):
-        for bit in range(SBOX_BITS):
-            bits_offset = ((NUM_SBOXES - (sbox-1) - 1) * SBOX_BITS) + bit
-            # if 'sbox' has a 1 in the position 'bit' then take note of that
-            if permuted & (1 << bits_offset) != 0:
-                if sbox not in sboxes_reached:
-                    sboxes_reached[sbox] = []
-                sboxes_reached[sbox].append(SBOX_BITS - bit)
-    # return which sboxes where reached and in which bit
-    return sboxes_reached
-
-# convert a list of bits to an integer
-def bits_to_num(inputbits):
-    Y_input = 0
-    for input_pos in inputbits:
-        Y_input |= 1 << (SBOX_BITS - input_pos)
-    return Y_input
+from basic_SPN import *
 
-# convert an integer to a list of it's bits
-def num_to_bits(num):
-    bits = []
-    for index in range(SBOX_BITS):
-        if (1 << index) & num > 0:
-            bits.append( SBOX_BITS - index )
-    return bits
-
-# this function eliminates the differential characteristics that have
-# a probability below the MIN_PROB threshold and then sorts the results
-def sort_diff_characteristics(diff_characteristics):
-    if not initialized: exit('initialize the library first!')
+initialized = False
 
-    sorted_diff_characteristics = []
-    for diff_characteristic in diff_characteristics:
-        probabilities = diff_characteristic['probabilities']
-
-        # calculate the resulting probability
-        resulting_probability = 1
-        for _, _, prob in probabilities:
-            resulting_probability *= prob
-        resulting_probability *= 100
-
-        # construct the element of the list resulting list
-        x, y, _ = probabilities[0]
-        _, num_sbox = diff_characteristic['start']
-        dx = x << ((NUM_SBOXES - (num_sbox-1) - 1) * SBOX_BITS)
-        entry = [resulting_probability, dx, diff_characteristic['state']]
-        # keep the entry only if has a probability grater than MIN_PROB
-        if resulting_probability > MIN_PROB:
-            sorted_diff_characteristics.append( entry )
-
-    # sort and return the result
-    sorted_diff_characteristics = sorted(sorted_diff_characteristics, key=lambda elem: fabs(elem[0]), reverse=True)
-    return sorted_diff_characteristics
-
-# calculate all the possible differential characteristics given the table
-def get_diff_characteristics(diff_chr_table, current_states=None, depth=1):
-    if not initialized: exit('initialize the library first!')
+# parity of every byte, the parity of a wider value is the xor of the parity of its bytes
+PARITY_TABLE = np.array([bin(x).count('1') & 1 for x in range(256)], dtype=np.uint8)
+
+# parity of every value of an array (up to 64 bits), folded to a byte and looked up
+def parity(values):
+    values = np.asarray(values, dtype=np.uint64)
+    for shift in (32, 16, 8):
+        values = values ^ (values >> np.uint64(shift))
+    return PARITY_TABLE[(values & np.uint64(0xff)).astype(np.intp)]
+
+# elements of the (keys x pairs) matrices built at once by the key search
+HITS_CHUNK_ELEMENTS = 1 << 24
+
+# below this many (key, pair) combinations the key search stays in this process
+# (it runs at 0.1-2 ns per combination and a pool of workers costs 10-15 ms to
+# start, so the split only pays off from some 30 ms of work: an 8 bit guess over
+# thousands of pairs takes a few ms, a 16 bit one over a thousand pairs is worth it)
+PARALLEL_MIN_WORK = 1 << 26
+
+# the largest key guess the key search takes on (its hits come back as one list)
+MAX_KEY_BITS = 28
+
+# where analize_cipher keeps its results (change the version when their format changes)
+CHARACTERISTICS_CACHE_DIR = os.path.join(os.environ.get('CIPHERSCORE_CACHE_DIR',
+                                                        os.path.join(os.path.expanduser('~'), '.cache', 'cipherscore')),
+                                         'characteristics')
+CHARACTERISTICS_CACHE_VERSION = 1
+CHARACTERISTICS_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# on disk cache of the differential characteristics, one json file per cipher fingerprint
+# the least recently used files are deleted when the directory grows over max_bytes
+class CharacteristicsCache:
+
+    def __init__(self, path=CHARACTERISTICS_CACHE_DIR, max_bytes=CHARACTERISTICS_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def get_file(self, fingerprint):
+        return os.path.join(self.path, fingerprint + '.json')
+
+    def get(self, fingerprint):
+        try:
+            with open(self.get_file(fingerprint), encoding='utf-8') as f:
+                data = json.load(f)
+            # mark it as recently used
+            os.utime(self.get_file(fingerprint))
+        except (OSError, ValueError):
+            return None
+
+        if data.get('version') != CHARACTERISTICS_CACHE_VERSION:
+            return None
+
+        # json only has string keys, the states are stored as [sbox, bits] pairs
+        return [[prob, dx, {sbox: bits for sbox, bits in state}] for prob, dx, state in data['characteristics']]
+
+    def put(self, fingerprint, diff_characteristics):
+        data = {
+            'version': CHARACTERISTICS_CACHE_VERSION,
+            'characteristics': [[prob, dx, list(state.items())] for prob, dx, state in diff_characteristics],
+        }
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            # write and rename, so a reader never sees half a file
+            temp_file = self.get_file(fingerprint) + '.{:d}.tmp'.format(os.getpid())
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(temp_file, self.get_file(fingerprint))
+            self.evict()
+        except OSError:
+            # the cache is only an optimization
+            pass
+
+    def evict(self):
+        files = []
+        for name in os.listdir(self.path):
+            if name.endswith('.json'):
+                stat = os.stat(os.path.join(self.path, name))
+                files.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.path, name))
+            total -= size
+
+characteristics_cache = CharacteristicsCache()
+
+# a (partial) differential characteristic:
+#   probability: product of the probabilities of its steps
+#   start: [depth, num_sbox] of the first sbox
+#   path: the last (x, y, bias) step, linked to the previous ones as (previous path, step)
+#   state: ((sbox, bits), ...) reached in the last round
+DiffCharacteristic = namedtuple('DiffCharacteristic', ['probability', 'start', 'path', 'state'])
+
+# the (x, y, bias) steps of a path, from the first to the last
+def get_path_steps(path):
+    steps = []
+    while path is not None:
+        path, step = path
+        steps.append(step)
+    return steps[::-1]
+
+# get_diff_characteristics used to return a list of dicts ('start', 'probabilities', 'state'),
+# this turns one of its records back into that dict, for code written against the old format
+def diff_characteristic_as_dict(diff_characteristic):
+    return {'start': list(diff_characteristic.start),
+            'probabilities': [list(step) for step in get_path_steps(diff_characteristic.path)],
+            'state': {sbox: list(bits) for sbox, bits in diff_characteristic.state}}
+
+# what the differential and the linear analyzers have in common: the description of
+# the cipher, its tables and the search of the paths through its rounds
+class SPNAnalyzer:
+
+    def __init__(self, sbox_bits, num_sboxes, num_rounds, max_blocks_to_bf, do_sbox, do_inv_sbox, do_pbox):
+        self.sbox_bits = sbox_bits
+        self.num_sboxes = num_sboxes
+        self.num_rounds = num_rounds
+        self.max_blocks_to_bf = max_blocks_to_bf
+        self.do_sbox = do_sbox
+        self.do_inv_sbox = do_inv_sbox
+        self.do_pbox = do_pbox
+
+        # tables built the first time they are needed
+        self.sbox_table = None
+        self.inv_sbox_table = None
+        self.pbox_tables = None
+        self.destinations = {}
+
+        # why the last search stopped early: 'time', 'memory' (max_queue) or None
+        self.search_stopped_by = None
+
+    # evaluate the sbox once for every possible input
+    def get_sbox_table(self):
+        if self.sbox_table is None:
+            self.sbox_table = np.array([self.do_sbox(x) for x in range(1 << self.sbox_bits)], dtype=np.int64)
+        return self.sbox_table
+
+    # inverse sbox evaluated once for every possible output
+    def get_inv_sbox_table(self):
+        if self.inv_sbox_table is None:
+            self.inv_sbox_table = np.array([self.do_inv_sbox(x) for x in range(1 << self.sbox_bits)], dtype=np.int64)
+        return self.inv_sbox_table
+
+    # the pbox compiled to one 256 entry table per byte of the state (core/spn.py's compiler)
+    # do_pbox is supposed to transpose the state, so it is enough to know where each bit goes
+    def get_pbox_tables(self):
+        if self.pbox_tables is None:
+            block_bits = self.num_sboxes * self.sbox_bits
+            bit_map = [self.do_pbox(1 << bit).bit_length() - 1 for bit in range(block_bits)]
+            self.pbox_tables = make_bit_tables(bit_map, block_bits).tolist()
+        return self.pbox_tables
+
+    # pass a state through the pbox, one table lookup per byte
+    def permute(self, state):
+        permuted = 0
+        for table in self.get_pbox_tables():
+            permuted |= table[state & 0xff]
+            state >>= 8
+        return permuted
+
+    # from an sbox and the "output" of a bias y,
+    # calculate which sboxs will be reached and in which bits
+    def compute_destination(self, num_sbox, y):
+        # pass 'y' through the permutation
+        offset = (self.num_sboxes - (num_sbox-1) - 1) * self.sbox_bits
+        permuted = self.permute(y << offset)
+
+        sboxes_reached = {}
+        # sboxes go from 1 to self.num_sboxes from left to right
+        # bits go from 1 to self.sbox_bits from left to right
+        for sbox in range(1, self.num_sboxes + 1):
+            for bit in range(self.sbox_bits):
+                bits_offset = ((self.num_sboxes - (sbox-1) - 1) * self.sbox_bits) + bit
+                # if 'sbox' has a 1 in the position 'bit' then take note of that
+                if permuted & (1 << bits_offset) != 0:
+                    if sbox not in sboxes_reached:
+                        sboxes_reached[sbox] = []
+                    sboxes_reached[sbox].append(self.sbox_bits - bit)
+        # return which sboxes where reached and in which bit
+        return sboxes_reached
+
+    # the destinations of every sbox and output, computed once
+    # they are shared, never modify them
+    def get_destination(self, num_sbox, y):
+        if not self.destinations:
+            self.destinations = {(sbox, output): self.compute_destination(sbox, output)
+                                 for sbox in range(1, self.num_sboxes + 1)
+                                 for output in range(1 << self.sbox_bits)}
+        return self.destinations[(num_sbox, y)]
+
+    # convert a list of bits to an integer
+    def bits_to_num(self, inputbits):
+        Y_input = 0
+        for input_pos in inputbits:
+            Y_input |= 1 << (self.sbox_bits - input_pos)
+        return Y_input
+
+    # convert an integer to a list of it's bits
+    def num_to_bits(self, num):
+        bits = []
+        for index in range(self.sbox_bits):
+            if (1 << index) & num > 0:
+                bits.append( self.sbox_bits - index )
+        return bits
+
+    # best-first (branch and bound) search of the paths through the rounds: a path starts
+    # at one sbox and picks one move (output, weight) for every sbox it reaches, and its
+    # weight is the product of the weights of its moves (probabilities or correlations)
+    #   starts: (weight, input, num_sbox, output) of every possible first move
+    #   moves: the (output, weight) moves of an sbox given its input
+    #   scale: a complete path is worth |weight| * scale
+    #   keep: whether a path worth that much (or a bound of it) is wanted at all
+    # partial paths are kept in a priority queue ordered by an upper bound of what they
+    # can still be worth: their weight times the best move weight for every sbox still to
+    # be chosen (at least one per round left). the best bound is always expanded first,
+    # so complete paths come out already sorted from the best to the worst
+    # with top_k, nodes are also pruned against the k-th best complete path pushed so
+    # far, which nothing below it can beat (without top_k every path that keep() accepts
+    # is wanted, so only max_queue bounds the queue)
+    # yields (weight, input of the whole block, {final sbox: input bits}); a search cut
+    # by time_budget or max_queue is recorded in search_stopped_by
+    def best_first_search(self, starts, moves, scale, keep, top_k=None, time_budget=None, max_queue=None):
+        self.search_stopped_by = None
+        if not moves or top_k == 0:
+            return
+
+        deadline = time.monotonic() + time_budget if time_budget is not None else None
+        best_weight = max(abs(weight) for steps in moves.values() for _, weight in steps)
+
+        # a node is (weight, depth, input, sboxes of this round, how many of them are chosen,
+        # state of the next round). the state is a linked record (previous state, destinations
+        # of the last move) whose destinations are the shared get_destination dicts, so a move
+        # adds one pair instead of copying the state
+        # the bound assumes the best move weight for each pending sbox and each round left
+        def bound(weight, depth, remaining):
+            if depth == self.num_rounds:
+                return abs(weight) * scale
+            return abs(weight) * best_weight ** (remaining + self.num_rounds - 1 - depth) * scale
+
+        # the sboxes reached by a linked state and their input bits, in the order they were reached
+        def merge_state(state):
+            links = []
+            while state is not None:
+                state, destinations = state
+                links.append(destinations)
+            merged = {}
+            for destinations in reversed(links):
+                for sbox, bits in destinations.items():
+                    merged[sbox] = merged.get(sbox, []) + bits
+            return merged
+
+        queue = []
+        order = count()
+        # what the best top_k complete paths pushed are worth (a min-heap)
+        best_complete = []
+        def push(weight, depth, value, pending, chosen, state):
+            # a finished round: its reached sboxes are the ones to expand in the next round
+            # (the merged pending tuple is shared by every node of the round)
+            if chosen == len(pending) and depth < self.num_rounds:
+                depth += 1
+                pending, chosen = (), 0
+                if depth < self.num_rounds:
+                    pending, state = tuple(merge_state(state).items()), None
+                else:
+                    state = merge_state(state)
+            node_bound = bound(weight, depth, len(pending) - chosen)
+            if not keep(node_bound):
+                return
+            if top_k is not None and len(best_complete) == top_k and node_bound < best_complete[0]:
+                return
+            if depth == self.num_rounds:
+                if len(state) > self.max_blocks_to_bf:
+                    return
+                if top_k is not None:
+                    if len(best_complete) < top_k:
+                        heapq.heappush(best_complete, node_bound)
+                    else:
+                        heapq.heappushpop(best_complete, node_bound)
+            heapq.heappush(queue, (-node_bound, next(order), weight, depth, value, pending, chosen, state))
+
+        for weight, x, num_sbox, y in starts:
+            value = x << ((self.num_sboxes - (num_sbox-1) - 1) * self.sbox_bits)
+            push(weight, 1, value, (), 0, (None, self.get_destination(num_sbox, y)))
+
+        found = 0
+        while queue:
+            if deadline is not None and time.monotonic() > deadline:
+                self.search_stopped_by = 'time'
+                return
+            if max_queue is not None and len(queue) > max_queue:
+                self.search_stopped_by = 'memory'
+                return
+
+            _, _, weight, depth, value, pending, chosen, state = heapq.heappop(queue)
+
+            # a complete path, nothing left in the queue can be better
+            # (push already dropped the ones keep() rejects or over MAX_BLOCKS_TO_BF)
+            if depth == self.num_rounds:
+                yield weight, value, state
+                found += 1
+                if top_k is not None and found >= top_k:
+                    return
+                continue
 
-    # run for NUM_ROUNDS - 1 times
-    if depth == NUM_ROUNDS:
-        # delete elements that involve more than MAX_BLOCKS_TO_BF final sboxes
-        current_states = [elem for elem in current_states if len(elem['state']) <= MAX_BLOCKS_TO_BF]
-        if len(current_states) == 0:
-            exit('No differential characteristic found! May be MIN_PROB is too high or MAX_BLOCKS_TO_BF too low.')
-        # return the differential characteristics that reach to no more than MAX_BLOCKS_TO_BF sboxes
-        return current_states
-
-    # at the beginnig, only one sbox can be chosen
-    # (this could be done differently)
-    if depth == 1:
-        # for each bias and each sbox, calculate which sboxes are reached (in the lower layer)
-        # this will be the next step's new initial state
-        current_states = []
+            # choose the move of the next pending sbox
+            curr_sbox, inputs = pending[chosen]
+            for y, move_weight in moves.get(self.bits_to_num(inputs), []):
+                push(weight * move_weight, depth, value, pending, chosen + 1, (state, self.get_destination(curr_sbox, y)))
+
+# holds the description of one cipher and its precomputed tables
+# several analyzers can be used at the same time (in threads or processes)
+class DifferentialAnalyzer(SPNAnalyzer):
+
+    def __init__(self, num_p_c_pairs, sbox_bits, num_sboxes, num_rounds, min_prob, max_blocks_to_bf, do_sbox, do_inv_sbox, do_pbox):
+        super().__init__(sbox_bits, num_sboxes, num_rounds, max_blocks_to_bf, do_sbox, do_inv_sbox, do_pbox)
+        self.num_c_pairs = num_p_c_pairs
+        self.min_prob = min_prob
+
+    def create_diff_table(self):
+        # Calculate the maximum value / differential
+        ssize = 1 << self.sbox_bits
+        sbox_table = self.get_sbox_table()
+
+        # every possible first input (columns) against every non-zero differential (rows)
+        x1 = np.arange(ssize)
+        dx = np.arange(1, ssize)
+        x2 = x1[np.newaxis, :] ^ dx[:, np.newaxis]
+
+        # output differential of every pair, all at once
+        dy = sbox_table[x1][np.newaxis, :] ^ sbox_table[x2]
+
+        # histogram of the (dx, dy) pairs is the table of differences
+        index = dx[:, np.newaxis] * ssize + dy
+        table = np.bincount(index.ravel(), minlength=ssize * ssize).reshape(ssize, ssize)
+
+        return table
+
+    # only keeps the dx and dy pairs that have more than zero hits
+    def reduce_table(self, table):
+        ssize = 1 << self.sbox_bits
+
+        probs = np.asarray(table) / ssize
+        dxs, dys = np.nonzero(probs * 100 >= self.min_prob)
+
+        # each element consist in dx, dy and the probability
+        return [list(elem) for elem in zip(dxs.tolist(), dys.tolist(), probs[dxs, dys].tolist())]
+
+    # create the reduced table, already sorted from the best to the worst probability
+    def create_reduced_diff_table(self):
+        # stable sort, so equal probabilities keep the (dx, dy) order
+        return sorted(self.reduce_table(self.create_diff_table()), key=lambda elem: -elem[2])
+
+    # the MIN_PROB test (MIN_PROB is a percentage), the same for partial and complete characteristics
+    def above_min_prob(self, probability):
+        return probability * 100 > self.min_prob
+
+    # this function eliminates the differential characteristics that have
+    # a probability below the MIN_PROB threshold and then sorts the results
+    # with top_k only the best top_k are kept (in a heap, so memory stays bounded)
+    def sort_diff_characteristics(self, diff_characteristics, top_k=None):
+        # calculate the resulting probability, keep it only if it is grater than MIN_PROB
+        def candidates():
+            for diff_characteristic in diff_characteristics:
+                if self.above_min_prob(diff_characteristic.probability):
+                    yield diff_characteristic.probability * 100, diff_characteristic
+
+        # sort, equal probabilities keep their order
+        if top_k is None:
+            best = sorted(candidates(), key=lambda elem: fabs(elem[0]), reverse=True)
+        else:
+            best = heapq.nlargest(top_k, candidates(), key=lambda elem: fabs(elem[0]))
+
+        # construct the elements of the resulting list
+        sorted_diff_characteristics = []
+        for resulting_probability, diff_characteristic in best:
+            x, _, _ = get_path_steps(diff_characteristic.path)[0]
+            _, num_sbox = diff_characteristic.start
+            dx = x << ((self.num_sboxes - (num_sbox-1) - 1) * self.sbox_bits)
+            state = {sbox: list(bits) for sbox, bits in diff_characteristic.state}
+            sorted_diff_characteristics.append( [resulting_probability, dx, state] )
+        return sorted_diff_characteristics
+
+    # generate all the possible differential characteristics given the table
+    # (the ones that reach no more than MAX_BLOCKS_TO_BF final sboxes)
+    # they are generated depth first, one at a time, as DiffCharacteristic records
+    # whose paths share the steps they have in common instead of copying them
+    # (this is a generator of records, not the old list of dicts: wrap it in list() and
+    # use diff_characteristic_as_dict() where the old format is needed)
+    def get_diff_characteristics(self, diff_chr_table):
+        # the possible moves of an sbox given its input, in the table order
+        moves = {}
         for x, y, bias in diff_chr_table:
+            moves.setdefault(x, []).append((x, y, bias))
+
+        def expand(diff_characteristic, depth):
+            # run for NUM_ROUNDS - 1 times
+            if depth == self.num_rounds:
+                if len(diff_characteristic.state) <= self.max_blocks_to_bf:
+                    yield diff_characteristic
+                return
+
+            # for each sbox that we last reached, calculate all possible moves according
+            # to the bias table (the sboxes without any are left out)
+            possible_steps = []
+            for curr_sbox, inputs in diff_characteristic.state:
+                steps = moves.get(self.bits_to_num(inputs))
+                if steps:
+                    possible_steps.append([(curr_sbox, step) for step in steps])
 
-            for num_sbox in range(1, NUM_SBOXES + 1):
-
-                sboxes_reached = get_destination(num_sbox, y)
+            # combine all the possible choises of each sbox in all possible ways
+            # (the first sbox changes the fastest)
+            for combination in product(*reversed(possible_steps)):
+                probability = diff_characteristic.probability
+                path = diff_characteristic.path
+                state = {}
+                for curr_sbox, step in reversed(combination):
+                    probability *= step[2]
+                    path = (path, step)
+                    # add the final sboxes and their inputs
+                    for destination, new_bits in self.get_destination(curr_sbox, step[1]).items():
+                        state[destination] = state.get(destination, ()) + tuple(new_bits)
 
-                entry = {}
-                entry['start']  = [depth, num_sbox]
-                entry['probabilities'] = [[x, y, bias]]
-                entry['state']  = sboxes_reached
+                if self.above_min_prob(probability):
+                    next_characteristic = DiffCharacteristic(probability, diff_characteristic.start, path, tuple(state.items()))
+                    yield from expand(next_characteristic, depth + 1)
 
-                current_states.append( entry )
-        # call the function recursevely with the new current state and new depth
-        return get_diff_characteristics(diff_chr_table, current_states, depth + 1)
+        # at the beginnig, only one sbox can be chosen
+        for x, y, bias in diff_chr_table:
+            for num_sbox in range(1, self.num_sboxes + 1):
+                state = tuple((sbox, tuple(bits)) for sbox, bits in self.get_destination(num_sbox, y).items())
+                first_characteristic = DiffCharacteristic(bias, (1, num_sbox), (None, (x, y, bias)), state)
+                yield from expand(first_characteristic, 2)
+
+    # best-first (branch and bound) search of the differential characteristics
+    # (see SPNAnalyzer.best_first_search), the probabilities of the sbox moves multiply
+    # complete characteristics come out already sorted from the best to the worst probability
+    # stops after top_k results, time_budget seconds or when the queue holds more than
+    # max_queue partial characteristics (which bounds its memory), whichever comes first
+    def search_diff_characteristics(self, diff_chr_table, top_k=None, time_budget=None, max_queue=None):
+        # the possible moves of an sbox given its input, in the table order
+        moves = {}
+        for x, y, bias in diff_chr_table:
+            moves.setdefault(x, []).append((y, bias))
+
+        # at the beginnig, only one sbox can be chosen
+        starts = ((bias, x, num_sbox, y) for x, y, bias in diff_chr_table for num_sbox in range(1, self.num_sboxes + 1))
+
+        for prob, dx, state in self.best_first_search(starts, moves, 1, self.above_min_prob, top_k, time_budget, max_queue):
+            yield [prob * 100, dx, state]
+
+    # identifies the cipher and the search settings: the sbox table, where the pbox
+    # sends every bit, the rounds, MIN_PROB, MAX_BLOCKS_TO_BF and top_k
+    def get_fingerprint(self, top_k=None):
+        block_bits = self.num_sboxes * self.sbox_bits
+        data = {
+            'version': CHARACTERISTICS_CACHE_VERSION,
+            'sbox_bits': self.sbox_bits,
+            'num_sboxes': self.num_sboxes,
+            'num_rounds': self.num_rounds,
+            'min_prob': self.min_prob,
+            'max_blocks_to_bf': self.max_blocks_to_bf,
+            'top_k': top_k,
+            'sbox': self.get_sbox_table().tolist(),
+            'pbox': [self.permute(1 << bit) for bit in range(block_bits)],
+        }
+        return hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def analize_cipher(self, top_k=None, time_budget=None, use_cache=True, max_queue=None):
+        # the same cipher has been analized before
+        self.search_stopped_by = None
+        if use_cache:
+            fingerprint = self.get_fingerprint(top_k)
+            diff_characteristics = characteristics_cache.get(fingerprint)
+            if diff_characteristics is not None:
+                return diff_characteristics
+
+        # analize the sbox and create the bias table (reduced and sorted)
+        table_sorted = self.create_reduced_diff_table()
+
+        # search the differential characteristics, from the best to the worst
+        # (the best top_k only, or the ones found within the time and queue budgets)
+        diff_characteristics = list(self.search_diff_characteristics(table_sorted, top_k, time_budget, max_queue))
+
+        # a search cut by a budget may have missed some, do not keep it
+        if use_cache and self.search_stopped_by is None:
+            characteristics_cache.put(fingerprint, diff_characteristics)
+
+        return diff_characteristics
+
+    # obtain the difference between the two ciphertexts
+    def get_diff(self, c1, c2, key, diff_characteristic):
+        _, _, c_data = diff_characteristic
+
+        # for each final sbox, get the according ciphertext block
+        diff_total = 0
+        i = len(c_data) - 1
+        for c_block_num in c_data:
+            # obtain the desired difference
+            c_bits = c_data[c_block_num]
+            c_diff = self.bits_to_num(c_bits)
+
+            # get the c1 block
+            ct1 = c1 >> ((self.num_sboxes - c_block_num) * self.sbox_bits)
+            ct1 = ct1 & ((1 << self.sbox_bits) - 1)
+            # get the c2 block
+            ct2 = c2 >> ((self.num_sboxes - c_block_num) * self.sbox_bits)
+            ct2 = ct2 & ((1 << self.sbox_bits) - 1)
+
+            # get the key block that corresponds with the sbox
+            k = key >> (i * self.sbox_bits)
+            k = k & ((1 << self.sbox_bits) - 1)
+
+            # xor the key and the ciphertext to get v (the sbox output)
+            v1 = ct1 ^ k
+            v2 = ct2 ^ k
+
+            # get the sbox input
+            # do_inv_sbox is supposed to calculate the inverse of the substitution, make sure is well defined!
+            u1 = self.do_inv_sbox(v1)
+            u2 = self.do_inv_sbox(v2)
+
+            # add the xor between the actual difference and the desired difference
+            diff_total += u1 ^ u2 ^ c_diff
+
+            i -= 1
+
+        # return the result of the full xor
+        return diff_total
+
+    # the ciphertext pairs as a (pairs x 2) array
+    def c_pairs_to_array(self, c_pairs):
+        if isinstance(c_pairs, np.ndarray):
+            return c_pairs
+        try:
+            return np.asarray(c_pairs, dtype=np.uint64).reshape(-1, 2)
+        except OverflowError:
+            # blocks wider than 64 bits, python integers still know how to shift them
+            return np.asarray(c_pairs, dtype=object).reshape(-1, 2)
+
+    # for each final sbox, a (keys x pairs) matrix telling if the key block
+    # gives the desired difference for the pair, all computed at once
+    def get_block_matches(self, c_pairs, diff_characteristic):
+        _, _, c_data = diff_characteristic
+
+        inv_sbox_table = self.get_inv_sbox_table()
+        c_pairs = self.c_pairs_to_array(c_pairs)
+        block_mask = (1 << self.sbox_bits) - 1
+        keys = np.arange(1 << self.sbox_bits)[:, np.newaxis]
+
+        matches = []
+        for c_block_num in c_data:
+            # obtain the desired difference
+            c_diff = self.bits_to_num(c_data[c_block_num])
+
+            # get the c1 and c2 blocks of every pair
+            shift = (self.num_sboxes - c_block_num) * self.sbox_bits
+            ct1 = ((c_pairs[:, 0] >> shift) & block_mask).astype(np.int64)
+            ct2 = ((c_pairs[:, 1] >> shift) & block_mask).astype(np.int64)
+
+            # xor every key with the ciphertexts and go back through the sbox
+            u1 = inv_sbox_table[ct1[np.newaxis, :] ^ keys]
+            u2 = inv_sbox_table[ct2[np.newaxis, :] ^ keys]
+
+            matches.append((u1 ^ u2) == c_diff)
+
+        return matches
+
+    # count the hits of the keys in [keystart, keyend) from the block matches
+    # a key is a hit for a pair when all of its blocks match, so the count for the
+    # first blocks (the key prefix) and the last block is a matrix product
+    def count_hits(self, matches, keystart, keyend):
+        if keyend <= keystart:
+            return []
+
+        ssize = 1 << self.sbox_bits
+        *prefix_matches, last_matches = matches
+        num_pairs = last_matches.shape[1]
+
+        # float32 counts are exact up to 2^24 pairs
+        dtype = np.float32 if num_pairs < (1 << 24) else np.float64
+        last_matches = last_matches.T.astype(dtype)
+
+        prefix_start = keystart // ssize
+        prefix_end = ceil(keyend / ssize)
+
+        # go through the prefixes in chunks, so memory stays bounded
+        chunk_size = max(1, HITS_CHUNK_ELEMENTS // max(1, num_pairs))
+
+        hits = []
+        for chunk_start in range(prefix_start, prefix_end, chunk_size):
+            prefixes = np.arange(chunk_start, min(chunk_start + chunk_size, prefix_end))
+
+            joint = np.ones((len(prefixes), num_pairs), dtype=bool)
+            digits = prefixes.copy()
+            for block_matches in reversed(prefix_matches):
+                joint &= block_matches[digits % ssize]
+                digits //= ssize
+
+            hits.append((joint.astype(dtype) @ last_matches).ravel())
 
-    else:
-        # for each set of possible states it will do the following:
-        #   for each sbox that we last reached,
-        #   it will calculate all possible moves according to the bias table.
-        #   then it will calculate all possible the combinations of choices
-        # this set of combinations, will be our next 'current_states'
-        # lastly, it will call itself recursevely
-        next_states = []
-        for current_state in current_states:
+        offset = prefix_start * ssize
+        hits = np.concatenate(hits)[keystart - offset:keyend - offset]
+        return hits.astype(np.int64).tolist()
 
-            curr_pos = current_state['state']
+    def get_hits_for_key_space(self, keystart, keyend, c_pairs, diff_characteristic):
 
-            # calculate all possible moves from 'curr_sbox'
-            total_combinations = 1
-            start_sboxes = {}
-            possible_step_per_sbox = {}
-            num_possible_step_per_sbox = {}
-            num_start_sboxes = 0
-            for curr_sbox in curr_pos:
+        # get the result of the aproximation for each possible key
+        hits = self.count_hits(self.get_block_matches(c_pairs, diff_characteristic), keystart, keyend)
 
-                inputs  = curr_pos[curr_sbox]
-                Y_input = bits_to_num(inputs)
+        result = {'start': keystart, 'end': keyend, 'hits': hits}
+        return result
 
-                possible_steps = []
 
-                # only use the biases which input matches the current sbox
-                possible_biases = [ elem for elem in diff_chr_table if elem[0] == Y_input ]
-                for x, y, bias in possible_biases:
+    # pack the ciphertext pairs in a compact buffer, so they are sent once to each worker
+    def pack_c_pairs(self, c_pairs):
+        if self.num_sboxes * self.sbox_bits <= 64:
+            return np.asarray(c_pairs, dtype=np.uint64).reshape(-1, 2).tobytes()
+        # blocks wider than 64 bits can not be packed, send them as they are
+        return [tuple(pair) for pair in c_pairs]
 
-                    sboxes_reached = get_destination(curr_sbox, y)
+    def get_hits(self, c_pairs, diff_characteristic, num_workers=None):
+        # calculate how many key bits must be brute forced
+        key_bits = len(diff_characteristic[2]) * self.sbox_bits
+        if key_bits > MAX_KEY_BITS:
+            exit('the amount of key bits to brute force is too large.')
 
-                    step = {'to': sboxes_reached, 'path': [x, y, bias]}
+        # get the key's maximum size
+        key_max = 1 << key_bits
+        num_workers = num_workers or multiprocessing.cpu_count()
 
-                    possible_steps.append(step)
+        # small key spaces are faster to do here than to send to other processes
+        if key_max * len(c_pairs) < PARALLEL_MIN_WORK or num_workers < 2:
+            return self.get_hits_for_key_space(0, key_max, c_pairs, diff_characteristic)['hits']
 
+        hits = [0] * key_max
 
-                if len(possible_steps) > 0:
-                    total_combinations *= len(possible_steps)
-                    possible_step_per_sbox[curr_sbox] = possible_steps
-                    start_sboxes[num_start_sboxes] = curr_sbox
-                    num_possible_step_per_sbox[curr_sbox] = len(possible_steps)
-                    num_start_sboxes += 1
+        # a few ranges per worker, so a slow range does not keep the others waiting
+        key_ranges = split_key_space(key_max, num_workers * 4)
 
-            if total_combinations == 0:
-                continue
+        # run in num_workers processes, the analyzer and the pairs are sent once to each of them
+        with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers,
+                                                    initializer=init_hits_worker,
+                                                    initargs=(self, self.pack_c_pairs(c_pairs), diff_characteristic)) as executor:
 
-            # combine all the possible choises of each sbox in all possible ways
-            # for example, if there are 2 sboxes and each has 4 possible moves
-            # then calculate all 16 (4x4) possible combinations.
+            future_list = [executor.submit(get_hits_worker, start, end) for start, end in key_ranges]
 
+            # join all the results
+            for future in concurrent.futures.as_completed(future_list):
+                result = future.result()
+                hits[result['start']:result['end']] = result['hits']
 
-            possible_steps_combinations = []
+        return hits
 
-            for comb_num in range(total_combinations):
-                new_comb = []
-                new_comb.append( possible_step_per_sbox[start_sboxes[0]][comb_num % num_possible_step_per_sbox[start_sboxes[0]]] )
-                for sbox in start_sboxes:
-                    if sbox == 0:
-                        continue
-                    real_sbox = start_sboxes[sbox]
+def apply_mask(value, mask):
+    #retrieve the parity of mask/value, a byte at a time
+    interValue = value & mask
+    total = 0
+    while interValue > 0:
+        total ^= int(PARITY_TABLE[interValue & 0xff])
+        interValue = interValue >> 8
+    return total
 
-                    mod = 1
-                    for prev_sbox in range(sbox):
-                        mod *= num_possible_step_per_sbox[start_sboxes[prev_sbox]]
+# split the key space into 'parts' ranges that cover it exactly
+def split_key_space(key_max, parts):
+    base, extra = divmod(key_max, parts)
+    ranges = []
+    start = 0
+    for part in range(parts):
+        end = start + base + (1 if part < extra else 0)
+        if end > start:
+            ranges.append((start, end))
+        start = end
+    return ranges
+
+def unpack_c_pairs(buffer):
+    if isinstance(buffer, bytes):
+        return np.frombuffer(buffer, dtype=np.uint64).reshape(-1, 2)
+    return buffer
+
+# state of each worker process, set once by init_hits_worker
+worker_analyzer = None
+worker_matches = None
+
+def init_hits_worker(analyzer, c_pairs_buffer, diff_characteristic):
+    global worker_analyzer, worker_matches
+    worker_analyzer = analyzer
+    worker_matches = analyzer.get_block_matches(unpack_c_pairs(c_pairs_buffer), diff_characteristic)
+
+def get_hits_worker(keystart, keyend):
+    return {'start': keystart, 'end': keyend, 'hits': worker_analyzer.count_hits(worker_matches, keystart, keyend)}
+
+# the analyzer used by the functions below, set by initialize()
+default_analyzer = None
 
-                    index = (comb_num / mod) % num_possible_step_per_sbox[real_sbox]
-                    index = int(index)
+# I know this is ugly
+def initialize(num_p_c_pairs, sbox_bits , num_sboxes, num_rounds, min_prob, max_blocks_to_bf, do_sbox_param, do_inv_sbox_param, do_pbox_param):
+    global NUM_C_PAIRS, SBOX_BITS , NUM_SBOXES, NUM_ROUNDS, MIN_PROB, MAX_BLOCKS_TO_BF, do_sbox, do_inv_sbox, do_pbox, initialized, default_analyzer
+    NUM_C_PAIRS = num_p_c_pairs
+    SBOX_BITS = sbox_bits
+    NUM_SBOXES = num_sboxes
+    NUM_ROUNDS = num_rounds
+    MIN_PROB = min_prob
+    MAX_BLOCKS_TO_BF = max_blocks_to_bf
+    do_sbox = do_sbox_param
+    do_inv_sbox = do_inv_sbox_param
+    do_pbox = do_pbox_param
+    default_analyzer = DifferentialAnalyzer(num_p_c_pairs, sbox_bits, num_sboxes, num_rounds, min_prob, max_blocks_to_bf,
+                                            do_sbox_param, do_inv_sbox_param, do_pbox_param)
+    initialized = True
 
-                    new_comb.append( possible_step_per_sbox[real_sbox][index] )
-                possible_steps_combinations.append(new_comb)
+def get_analyzer():
+    if not initialized: exit('initialize the library first!')
+    return default_analyzer
 
+# the old module functions, they work on the analyzer set by initialize()
+def get_sbox_table():
+    return get_analyzer().get_sbox_table()
 
-            # now, for each combination, check to which sboxes we reached and what are their inputs
-            # this will be the next state
-            for possible_step in possible_steps_combinations:
+def create_diff_table():
+    return get_analyzer().create_diff_table()
 
-                # save the first sbox and the previous biases
-                entry = {}
-                entry['start'] = current_state['start']
-                entry['probabilities'] = current_state['probabilities'].copy()
-                entry['state'] = {}
+def reduce_table(table):
+    return get_analyzer().reduce_table(table)
 
-                # add the new biases
-                for elem in possible_step:
-                    entry['probabilities'].append( elem['path'] )
+def create_reduced_diff_table():
+    return get_analyzer().create_reduced_diff_table()
 
-                    # add the final sboxes and their inputs
-                    for destination in elem['to']:
-                        if destination not in entry['state']:
-                            entry['state'][destination] = []
+def get_destination(num_sbox, y):
+    return get_analyzer().get_destination(num_sbox, y)
 
-                        new_bits = elem['to'][destination]
-                        entry['state'][destination] += new_bits
+def bits_to_num(inputbits):
+    return get_analyzer().bits_to_num(inputbits)
 
+def num_to_bits(num):
+    return get_analyzer().num_to_bits(num)
 
-                # calculate the resulting Probability
-                biases = entry['probabilities']
-                resulting_bias = 1
-                for _, _, bias in biases:
-                    resulting_bias *= bias
-                resulting_bias *= 100
-                if resulting_bias >= MIN_PROB:
-                    # update the next_states
-                    next_states.append( entry )
+def sort_diff_characteristics(diff_characteristics, top_k=None):
+    return get_analyzer().sort_diff_characteristics(diff_characteristics, top_k)
 
+def get_diff_characteristics(diff_chr_table):
+    return get_analyzer().get_diff_characteristics(diff_chr_table)
 
-        return get_diff_characteristics(diff_chr_table, next_states, depth + 1)
+def search_diff_characteristics(diff_chr_table, top_k=None, time_budget=None, max_queue=None):
+    return get_analyzer().search_diff_characteristics(diff_chr_table, top_k, time_budget, max_queue)
 
-def analize_cipher():
-    if not initialized: exit('initialize the library first!')
+def analize_cipher(top_k=None, time_budget=None, use_cache=True, max_queue=None):
+    return get_analyzer().analize_cipher(top_k, time_budget, use_cache, max_queue)
 
-    # analize the sbox and create the bias table
-    table = create_diff_table()
-    table = reduce_table(table)
-    table_sorted = sorted(table, key=lambda elem: fabs(elem[2]), reverse=True)
-
-    # take the best max_size results (so that the following algorithm finishes quickly)
-    max_size = 1000
-    table_len = len(table_sorted)
-    if table_len > max_size:
-        print('\n[*] reducing bias table size from {:d} to {:d}\n'.format(table_len, max_size))
-        table_sorted = table_sorted[:max_size]
-
-    # calculate all possible differential characteristics
-    diff_characteristics = get_diff_characteristics(table_sorted)
-    # sort the list from the best approximations to the worst
-    diff_characteristics_sorted = sort_diff_characteristics(diff_characteristics)
-    # return the sorted list of approximations
-    return diff_characteristics_sorted
-
-# obtain the difference between the two ciphertexts
 def get_diff(c1, c2, key, diff_characteristic):
-    _, _, c_data = diff_characteristic
-
-    # for each final sbox, get the according ciphertext block
-    diff_total = 0
-    i = len(c_data) - 1
-    for c_block_num in c_data:
-        # obtain the desired difference
-        c_bits = c_data[c_block_num]
-        c_diff = bits_to_num(c_bits)
-
-        # get the c1 block
-        ct1 = c1 >> ((NUM_SBOXES - c_block_num) * SBOX_BITS)
-        ct1 = ct1 & ((1 << SBOX_BITS) - 1)
-        # get the c2 block
-        ct2 = c2 >> ((NUM_SBOXES - c_block_num) * SBOX_BITS)
-        ct2 = ct2 & ((1 << SBOX_BITS) - 1)
-
-        # get the key block that corresponds with the sbox
-        k = key >> (i * SBOX_BITS)
-        k = k & ((1 << SBOX_BITS) - 1)
-
-        # xor the key and the ciphertext to get v (the sbox output)
-        v1 = ct1 ^ k
-        v2 = ct2 ^ k
+    return get_analyzer().get_diff(c1, c2, key, diff_characteristic)
 
-        # get the sbox input
-        # do_inv_sbox is supposed to calculate the inverse of the substitution, make sure is well defined!
-        u1 = do_inv_sbox(v1)
-        u2 = do_inv_sbox(v2)
+def get_inv_sbox_table():
+    return get_analyzer().get_inv_sbox_table()
 
-        # add the xor between the actual difference and the desired difference
-        diff_total += u1 ^ u2 ^ c_diff
+def get_block_matches(c_pairs, diff_characteristic):
+    return get_analyzer().get_block_matches(c_pairs, diff_characteristic)
 
-        i -= 1
-
-    # return the result of the full xor
-    return diff_total
+def count_hits(matches, keystart, keyend):
+    return get_analyzer().count_hits(matches, keystart, keyend)
 
 def get_hits_for_key_space(keystart, keyend, c_pairs, diff_characteristic):
+    return get_analyzer().get_hits_for_key_space(keystart, keyend, c_pairs, diff_characteristic)
 
-    try:
-        hits = [0] * (keyend - keystart)
-    except OverflowError:
-        exit('the amount of key bits to brute force is too large.')
-
-    # get the result of the aproximation for each possible key
-    for key in range(keystart, keyend):
-        for c1, c2 in c_pairs:
-            diff = get_diff(c1, c2, key, diff_characteristic)
-            if diff == 0:
-                hits[keystart - key] += 1
-
-    result = {'start': keystart, 'end': keyend, 'hits': hits}
-    return result
-
-def get_hits(c_pairs, diff_characteristic):
-    if not initialized: exit('initialize the library first!')
+def pack_c_pairs(c_pairs):
+    return get_analyzer().pack_c_pairs(c_pairs)
 
-    # calculate how many key bits must be brute forced
-    key_bits = len(diff_characteristic[2]) * SBOX_BITS
-    try:
-        # get the key's maximum size
-        key_max  = 1 << key_bits
-    except MemoryError:
-        exit('the amount of key bits to brute force is too large.')
-
-    num_cores = multiprocessing.cpu_count()
-
-    sub_key_space = key_max // num_cores
-
-    bias_lists = []
-
-    # run in num_cores threads
-    with concurrent.futures.ThreadPoolExecutor(max_workers=num_cores) as executor:
-
-        future_list = []
-        # divide the key space into num_cores parts
-        for core in range(num_cores):
-            start = sub_key_space * core
-            end   = start + sub_key_space
-
-            future = executor.submit(get_hits_for_key_space, start, end, c_pairs, diff_characteristic)
-            future_list.append(future)
-
-        # get the result for each thread
-        for future in concurrent.futures.as_completed(future_list):
-            bias_lists.append(future.result())
-
-    try:
-        hits = [0] * key_max
-    except OverflowError:
-        exit('the amount of key bits to brute force is too large.')
-
-    # join all the results
-    for result in bias_lists:
-        start = result['start']
-        end   = result['end']
-        array = result['hits']
-        for hit in range(start, end):
-            hits[hit] = array[start - hit]
-
-    return hits
+def get_hits(c_pairs, diff_characteristic, num_workers=None):
+    return get_analyzer().get_hits(c_pairs, diff_characteristic, num_workers)
 
 if __name__ == "__main__":
     print('import this in your script')
@@ -1,3 +1,12 @@
+import os
+import sys
+
+# the p-box table compiler is core/spn.py's (the repository root has to be importable)
+repo_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if repo_root not in sys.path:
+    sys.path.append(repo_root)
+from core.spn import make_bit_tables
+
 
 #6bit sbox.
 s = [16, 42, 28, 3, 26, 0, 31, 46, 27, 14, 49, 62, 37, 56, 23, 6, 40, 48, 53, 8, 20, 25, 33, 1, 2, 63, 15, 34, 55, 21, 39, 57, 54, 45, 47, 13, 7, 44, 61, 9, 60, 32, 22, 29, 52, 19, 12, 50, 5, 51, 11, 18, 59, 41, 36, 30, 17, 38, 10, 4, 58, 43, 35, 24]
@@ -12,21 +21,20 @@ def sbox(x):
 def sbox_inv(x):
     return s_inv[x]
 
-def pbox(x):
-    # if the texts are more than 32 bits,
-    # then we have to use longs
-    y = 0
-
-    # for each bit to be shuffled
-    for i in range(len(p)):
+# the p-box compiled to one lookup table per byte of the 36-bit state (core/spn.py's compiler)
+# p_tables[i][v] is where the bits of byte value v, placed at byte i, end up
+p_tables = make_bit_tables(p, len(p)).tolist()
+p_inv_tables = make_bit_tables([p.index(i) for i in range(len(p))], len(p)).tolist()
 
-        # if the original bit position
-        # is a 1, then make the result
-        # bit position have a 1
-        if (x & (1 << i)) != 0:
-            y = y ^ (1 << p[i])
-   
+def apply_p_tables(x, tables):
+    y = 0
+    for table in tables:
+        y |= table[x & 0xff]
+        x >>= 8
     return y
+
+def pbox(x):
+    return apply_p_tables(x, p_tables)
  
 def demux(x):
     y = []
@@ -78,12 +86,7 @@ def encrypt(key, p, rounds):
     return x
  
 def apbox(x):
-    y = 0
-    for i in range(len(p)):
-        if (x & (1 << i)) != 0:
-            pval = p.index(i)
-            y = y ^ (1 << pval)
-    return y
+    return apply_p_tables(x, p_inv_tables)
  
 def asbox(x):
     return s.index(x)
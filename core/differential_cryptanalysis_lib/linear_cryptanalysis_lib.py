@@ -0,0 +1,150 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# the linear counterpart of differential_cryptanalysis_lib, for the same SPN description
+# (the cipher tables, the parity helpers and the search are shared with it)
+
+import numpy as np
+
+from differential_cryptanalysis_lib import PARITY_TABLE, SPNAnalyzer, apply_mask, parity
+
+# fast walsh-hadamard transform of every column of 'table'
+def walsh_hadamard(table):
+    table = np.array(table, dtype=np.int64)
+    rows = table.shape[0]
+
+    half = 1
+    while half < rows:
+        # butterflies between the two halves of every group of 2 * half rows
+        groups = table.reshape(rows // (2 * half), 2, half, -1)
+        table = np.concatenate([groups[:, 0] + groups[:, 1], groups[:, 0] - groups[:, 1]], axis=1)
+        half *= 2
+
+    return table.reshape(rows, -1)
+
+# holds the description of one cipher and its precomputed tables
+# min_bias is the smallest bias (in absolute value, 0 to 0.5) worth keeping
+class LinearAnalyzer(SPNAnalyzer):
+
+    def __init__(self, num_p_c_pairs, sbox_bits, num_sboxes, num_rounds, min_bias, max_blocks_to_bf, do_sbox, do_inv_sbox, do_pbox):
+        super().__init__(sbox_bits, num_sboxes, num_rounds, max_blocks_to_bf, do_sbox, do_inv_sbox, do_pbox)
+        self.num_p_c_pairs = num_p_c_pairs
+        self.min_bias = min_bias
+
+    # the MIN_BIAS test, the same for partial and complete approximations
+    def above_min_bias(self, bias):
+        return bias >= self.min_bias
+
+    # linear approximation table: LAT[a][b] = #{x : a.x == b.S(x)} - 2^(SBOX_BITS-1)
+    def create_linear_table(self):
+        ssize = 1 << self.sbox_bits
+        sbox_table = self.get_sbox_table()
+
+        # (-1)^(b.S(x)) for every input x (rows) and output mask b (columns)
+        output_masks = np.arange(ssize)
+        signs = 1 - 2 * parity(sbox_table[:, np.newaxis] & output_masks[np.newaxis, :]).astype(np.int64)
+
+        # the transform over x adds (-1)^(a.x) for every input mask a at once
+        return walsh_hadamard(signs) // 2
+
+    # the (a, b, bias) approximations with a bias of at least MIN_BIAS,
+    # sorted from the best to the worst absolute bias
+    def create_reduced_linear_table(self):
+        ssize = 1 << self.sbox_bits
+
+        biases = self.create_linear_table() / ssize
+        # the zero masks are not approximations
+        biases[0, :] = 0
+        biases[:, 0] = 0
+        input_masks, output_masks = np.nonzero(np.abs(biases) >= max(self.min_bias, 1 / (2 * ssize)))
+        kept = biases[input_masks, output_masks]
+
+        # stable sort, so equal biases keep the (a, b) order
+        order = np.argsort(-np.abs(kept), kind='stable')
+        return [list(elem) for elem in zip(input_masks[order].tolist(), output_masks[order].tolist(), kept[order].tolist())]
+
+    # best-first (branch and bound) search of the linear approximations of the cipher
+    # (see SPNAnalyzer.best_first_search): by the piling-up lemma the bias of k sbox
+    # approximations is 2^(k-1) * prod(bias_i), that is half the product of their
+    # correlations (2 * bias_i), which can only shrink, so the correlations are the weights
+    # complete approximations come out from the best to the worst absolute bias
+    # each result is [bias, plaintext mask, {final sbox: input bits}]
+    def search_linear_approximations(self, linear_table, top_k=None, time_budget=None):
+        # the possible approximations of an sbox given its input mask, in the table order
+        moves = {}
+        for a, b, bias in linear_table:
+            moves.setdefault(a, []).append((b, 2 * bias))
+
+        # at the beginnig, only one sbox is approximated
+        starts = ((2 * bias, a, num_sbox, b) for a, b, bias in linear_table for num_sbox in range(1, self.num_sboxes + 1))
+
+        for correlation, p_mask, state in self.best_first_search(starts, moves, 1 / 2, self.above_min_bias, top_k, time_budget):
+            yield [correlation / 2, p_mask, state]
+
+    def analize_cipher(self, top_k=None, time_budget=None):
+        # analize the sbox, then search the approximations of the whole cipher
+        linear_table = self.create_reduced_linear_table()
+        return list(self.search_linear_approximations(linear_table, top_k, time_budget))
+
+    # matsui's algorithm 2: the bias of the approximation for every guess of the
+    # last round key bits (of the final sboxes), from known plaintext/ciphertext pairs
+    # the pairs are bucketed once by (plaintext parity, ciphertext blocks), then every
+    # guess is scored from the bucket counts with one small tensor product per block
+    # the index of each bias is the key used to obtain it
+    def get_key_biases(self, p_c_pairs, linear_approximation):
+        _, p_mask, state = linear_approximation
+
+        ssize = 1 << self.sbox_bits
+        block_mask = (1 << self.sbox_bits) - 1
+        inv_sbox_table = self.get_inv_sbox_table()
+
+        p_c_pairs = np.asarray(p_c_pairs, dtype=np.uint64).reshape(-1, 2)
+        num_pairs = len(p_c_pairs)
+
+        # bucket every pair by its plaintext parity and its final ciphertext blocks
+        index = parity(p_c_pairs[:, 0] & np.uint64(p_mask)).astype(np.intp)
+        for c_block_num in state:
+            shift = np.uint64((self.num_sboxes - c_block_num) * self.sbox_bits)
+            index = index * ssize + ((p_c_pairs[:, 1] >> shift) & np.uint64(block_mask)).astype(np.intp)
+        counts = np.bincount(index, minlength=2 * ssize ** len(state)).reshape((2,) + (ssize,) * len(state))
+
+        # pairs with an even plaintext parity count +1, the odd ones -1
+        correlations = counts[0] - counts[1]
+
+        # for each block, (-1)^(parity of the sbox input bits) for every key and ciphertext block
+        keys = np.arange(ssize)[:, np.newaxis]
+        c_blocks = np.arange(ssize)[np.newaxis, :]
+        for axis, c_block_num in enumerate(state):
+            u_mask = self.bits_to_num(state[c_block_num])
+            signs = 1 - 2 * parity(inv_sbox_table[c_blocks ^ keys] & u_mask).astype(np.int64)
+            # replace the ciphertext block axis by the key block axis
+            correlations = np.moveaxis(np.tensordot(signs, correlations, axes=([1], [axis])), 0, axis)
+
+        return (np.abs(correlations.ravel()) / (2 * num_pairs)).tolist()
+
+initialized = False
+
+# the analyzer used by the functions below, set by initialize()
+default_analyzer = None
+
+def initialize(num_p_c_pairs, sbox_bits , num_sboxes, num_rounds, min_bias, max_blocks_to_bf, do_sbox, do_inv_sbox, do_pbox):
+    global default_analyzer, initialized
+    default_analyzer = LinearAnalyzer(num_p_c_pairs, sbox_bits, num_sboxes, num_rounds, min_bias, max_blocks_to_bf,
+                                      do_sbox, do_inv_sbox, do_pbox)
+    initialized = True
+
+def get_analyzer():
+    if not initialized: exit('initialize the library first!')
+    return default_analyzer
+
+def create_linear_table():
+    return get_analyzer().create_linear_table()
+
+def analize_cipher(top_k=None, time_budget=None):
+    return get_analyzer().analize_cipher(top_k, time_budget)
+
+def get_key_biases(p_c_pairs, linear_approximation):
+    return get_analyzer().get_key_biases(p_c_pairs, linear_approximation)
+
+if __name__ == "__main__":
+    print('import this in your script')
@@ -1,10 +1,52 @@
 # core/interfaces.py
 from abc import ABC, abstractmethod
 
+import numpy as np
+
+
+def to_block_array(blocks, block_size):
+    """
+    Turns a contiguous buffer (bytes, bytearray, memoryview) or a NumPy
+    array of blocks into a (n, block_size) uint8 array.
+    A block_size of None accepts 2D arrays of any width (message-oriented ciphers).
+    """
+    if isinstance(blocks, np.ndarray):
+        arr = np.ascontiguousarray(blocks, dtype=np.uint8)
+    else:
+        arr = np.frombuffer(blocks, dtype=np.uint8)
+
+    if arr.ndim == 2 and block_size is None:
+        return arr
+    if arr.ndim == 1:
+        if block_size is None:
+            raise ValueError("A flat buffer needs a fixed block size to be split into blocks")
+        if len(arr) % block_size != 0:
+            raise ValueError(f"Buffer length {len(arr)} is not a multiple of the block size ({block_size} bytes)")
+        arr = arr.reshape(-1, block_size)
+    elif arr.ndim != 2 or arr.shape[1] != block_size:
+        raise ValueError(f"Expected blocks of {block_size} bytes, got an array of shape {arr.shape}")
+    return arr
+
+
+def map_blocks(func, blocks, key):
+    """
+    Scalar fallback of the batch API: calls func(block, key) once per row
+    of a (n, block_size) uint8 array and stacks the outputs.
+    """
+    raw = blocks.tobytes()
+    width = blocks.shape[1]
+    outputs = [func(raw[i:i + width], key) for i in range(0, len(raw), width)]
+    return np.frombuffer(b''.join(outputs), dtype=np.uint8).reshape(len(blocks), -1)
+
+
 class BaseCipher(ABC):
     """
     The Blueprint. Any cipher you want to test MUST follow these rules.
     """
+
+    # Size of one plaintext block in bytes
+    # (None for AEAD/stream ciphers that take whole messages in one call)
+    block_size = 8
     
     @property
     @abstractmethod
@@ -20,4 +62,18 @@ class BaseCipher(ABC):
     @abstractmethod
     def decrypt(self, ciphertext: bytes, key: bytes) -> bytes:
         """Core decryption logic"""
-        pass
\ No newline at end of file
+        pass
+
+    def encrypt_batch(self, blocks, key: bytes) -> np.ndarray:
+        """
+        Encrypts many blocks at once. 'blocks' is a contiguous buffer or a
+        NumPy array of blocks; returns a (n, output_size) uint8 array.
+        Override this with a vectorized version when the cipher allows it.
+        """
+        blocks = to_block_array(blocks, self.block_size)
+        return map_blocks(self.encrypt, blocks, key)
+
+    def decrypt_batch(self, blocks, key: bytes) -> np.ndarray:
+        """Batch counterpart of decrypt (same conventions as encrypt_batch)"""
+        blocks = to_block_array(blocks, self.block_size)
+        return map_blocks(self.decrypt, blocks, key)
@@ -28,7 +28,14 @@ def load_custom_cipher_from_text(code_string):
                     break
         
         if target_class:
-            return target_class() # Return an INSTANCE of the class
+            instance = target_class() # Return an INSTANCE of the class
+            # Classes created by exec() cannot be pickled, so keep the source
+            # around for worker processes to rebuild the cipher from it
+            try:
+                instance.source_code = code_string
+            except AttributeError:
+                pass
+            return instance
         else:
             raise ValueError("No valid Cipher class found. Did you define a class with encrypt/decrypt methods?")
             
@@ -1,54 +1,304 @@
 # core/metrics.py
-import time
-import tracemalloc
+import math
+import statistics
 
-def calculate_avalanche_effect(cipher, key, rounds=1000):
+import numpy as np
+
+from core.benchmark import benchmark_key_setup, measure_peak_memory, time_callable
+from core.interfaces import map_blocks
+from core.stats import chi2_sf, normal_sf
+
+# Number of set bits for every possible byte value (used instead of bin().count('1'))
+POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+# How many plaintext pairs are encrypted per batch (keeps memory bounded,
+# and is also the granularity of progress reports)
+AVALANCHE_BATCH_SIZE = 1024
+
+# Smaller batches in adaptive (early-stopping) mode, so convergence is checked more often
+ADAPTIVE_BATCH_SIZE = 256
+
+# Plaintexts per SAC batch (each one is encrypted once per input bit, plus once as is)
+SAC_BATCH_SIZE = 256
+
+# Plaintexts per BIC batch (same layout as the SAC batches)
+BIC_BATCH_SIZE = 256
+
+
+def popcount_rows(data):
+    """
+    Counts the set bits of every row of a 2D uint8 array.
+    """
+    return POPCOUNT_TABLE[data].sum(axis=1, dtype=np.int64)
+
+
+def encrypt_blocks(cipher, blocks, key):
+    """
+    Encrypts a (n, block_size) uint8 array of blocks.
+    Delegates to the cipher's 'encrypt_batch'; duck-typed custom ciphers
+    without one get BaseCipher's scalar fallback (map_blocks).
+    """
+    encrypt_batch = getattr(cipher, 'encrypt_batch', None)
+    if encrypt_batch is None:
+        return map_blocks(cipher.encrypt, blocks, key)
+    return np.asarray(encrypt_batch(blocks, key), dtype=np.uint8).reshape(len(blocks), -1)
+
+
+def make_flipped_pairs(rng, count, block_size):
+    """
+    Generates 'count' random plaintexts and their twins with exactly one bit flipped.
+    """
+    p1 = rng.integers(0, 256, size=(count, block_size), dtype=np.uint8)
+
+    # Bit index counts from the least significant bit of the big-endian block
+    bit_idx = rng.integers(0, block_size * 8, size=count)
+    byte_idx = block_size - 1 - (bit_idx >> 3)
+    p2 = p1.copy()
+    p2[np.arange(count), byte_idx] ^= (1 << (bit_idx & 7)).astype(np.uint8)
+    return p1, p2
+
+
+def avalanche_partial_sums(cipher, key, rounds, seed=None, on_batch=None, tolerance=None, z=1.96):
+    """
+    Runs 'rounds' bit-flip trials and returns exact integer partial sums:
+        {'rounds': trials done, 'diff_bits': total flipped output bits,
+         'diff_bits_sq': sum of squared per-trial counts, 'output_bits': bits per ciphertext}
+    Partial sums from independent shards can simply be added together.
+    'on_batch' (optional) is called with the running sums after every batch.
+
+    Adaptive mode: with a 'tolerance' (in percentage points) the trials stop
+    as soon as the confidence-interval half-width of the score drops below it;
+    'rounds' is then only a hard cap ('rounds' in the result says how many
+    samples were actually used).
+    """
+    rng = np.random.default_rng(seed)
+    block_size = getattr(cipher, 'block_size', None) or 8
+    batch_size = ADAPTIVE_BATCH_SIZE if tolerance else AVALANCHE_BATCH_SIZE
+
+    diff_bits = 0
+    diff_bits_sq = 0
+    output_bits = 0
+    done = 0
+
+    while done < rounds:
+        count = min(batch_size, rounds - done)
+
+        # 1. Generate random inputs and flip 1 bit in each
+        p1, p2 = make_flipped_pairs(rng, count, block_size)
+
+        # 2. Encrypt both (as a batch where possible)
+        c1 = encrypt_blocks(cipher, p1, key)
+        c2 = encrypt_blocks(cipher, p2, key)
+
+        # 3. Count diff (Hamming distance)
+        diff = popcount_rows(c1 ^ c2)
+        diff_bits += int(diff.sum())
+        diff_bits_sq += int((diff * diff).sum())
+        output_bits = c1.shape[1] * 8
+        done += count
+
+        sums = {'rounds': done, 'diff_bits': diff_bits, 'diff_bits_sq': diff_bits_sq,
+                'output_bits': output_bits}
+        if on_batch is not None:
+            on_batch(dict(sums))
+
+        # 4. Early stop once the estimate is tight enough
+        if tolerance and avalanche_half_width(sums, z) <= tolerance:
+            break
+
+    return {'rounds': done, 'diff_bits': diff_bits, 'diff_bits_sq': diff_bits_sq,
+            'output_bits': output_bits}
+
+def merge_avalanche_sums(parts):
+    """Adds up partial sums from avalanche_partial_sums (exact, integer arithmetic)"""
+    merged = {'rounds': 0, 'diff_bits': 0, 'diff_bits_sq': 0, 'output_bits': 0}
+    for part in parts:
+        merged['rounds'] += part['rounds']
+        merged['diff_bits'] += part['diff_bits']
+        merged['diff_bits_sq'] += part['diff_bits_sq']
+        merged['output_bits'] = merged['output_bits'] or part['output_bits']
+    return merged
+
+def avalanche_score(sums):
+    """Percentage of output bits that flipped, from (merged) partial sums"""
+    if sums['rounds'] == 0:
+        return 0.0
+    return sums['diff_bits'] / (sums['rounds'] * sums['output_bits']) * 100
+
+def avalanche_half_width(sums, z=1.96):
+    """
+    Half-width (in percentage points) of the normal-approximation confidence
+    interval of the avalanche score; inf with fewer than 2 trials.
+    """
+    n = sums['rounds']
+    if n < 2:
+        return float('inf')
+    mean = sums['diff_bits'] / n
+    variance = max(0.0, (sums['diff_bits_sq'] - n * mean * mean) / (n - 1))
+    return z * math.sqrt(variance / n) / sums['output_bits'] * 100
+
+def avalanche_interval(sums, z=1.96):
+    """
+    Normal-approximation confidence interval (in %) of the avalanche score.
+    z = 1.96 gives a 95% interval. Returns (low, high).
+    """
+    if sums['rounds'] < 2:
+        return 0.0, 100.0
+    half_width = avalanche_half_width(sums, z)
+    score = avalanche_score(sums)
+    return max(0.0, score - half_width), min(100.0, score + half_width)
+
+def calculate_avalanche_effect(cipher, key, rounds=1000, seed=None, on_batch=None, tolerance=None):
     """
     Runs bit-flip tests to see if output changes by ~50%.
+    With a 'tolerance' the test stops early once converged (see avalanche_partial_sums).
+    """
+    return avalanche_score(avalanche_partial_sums(cipher, key, rounds, seed, on_batch, tolerance))
+
+def calculate_sac_matrix(cipher, key, samples=1000, seed=None):
+    """
+    Strict Avalanche Criterion: for every input bit i, flips i over 'samples'
+    random plaintexts and records how often every output bit j changes.
+    Bits are numbered from the most significant bit of the block (bit 0).
+
+    Counts are accumulated batch by batch, so memory stays
+    O(input_bits x output_bits) whatever the number of samples.
+    Returns a dict with the (input_bits x output_bits) 'matrix' of flip
+    probabilities (NumPy array), the max deviation from 0.5 and a
+    chi-square summary against the ideal 0.5.
     """
-    import random
-    
-    total_diff_ratio = 0
-    
-    for _ in range(rounds):
-        # 1. Generate random input (8 bytes / 64 bits)
-        p1 = random.randbytes(8)
-        
-        # 2. Flip 1 bit
-        # (Logic to flip a random bit in p1 to create p2)
-        bit_idx = random.randint(0, 63)
-        p1_int = int.from_bytes(p1, 'big')
-        p2_int = p1_int ^ (1 << bit_idx)
-        p2 = p2_int.to_bytes(8, 'big')
-        
-        # 3. Encrypt both
-        c1 = cipher.encrypt(p1, key)
-        c2 = cipher.encrypt(p2, key)
-        
-        # 4. Count diff (Hamming distance)
-        diff = bin(int.from_bytes(c1, 'big') ^ int.from_bytes(c2, 'big')).count('1')
-        total_diff_ratio += (diff / (len(c1) * 8))
-
-    return (total_diff_ratio / rounds) * 100
-
-def measure_performance(cipher, plaintext, key, iterations=10000):
-    """
-    Measures Speed (Time) and Memory (RAM).
+    rng = np.random.default_rng(seed)
+    block_size = getattr(cipher, 'block_size', None) or 8
+    input_bits = block_size * 8
+
+    # Row i flips input bit i (MSB first, like np.unpackbits)
+    flip_masks = np.packbits(np.eye(input_bits, dtype=np.uint8), axis=1)
+
+    counts = None
+    done = 0
+    while done < samples:
+        count = min(SAC_BATCH_SIZE, samples - done)
+        p1 = rng.integers(0, 256, size=(count, block_size), dtype=np.uint8)
+
+        # All flipped variants of the batch go through the cipher in one call
+        p2 = (p1[None, :, :] ^ flip_masks[:, None, :]).reshape(-1, block_size)
+        c1 = encrypt_blocks(cipher, p1, key)
+        c2 = encrypt_blocks(cipher, p2, key).reshape(input_bits, count, -1)
+
+        changed = np.unpackbits(c1[None, :, :] ^ c2, axis=2)
+        batch_counts = changed.sum(axis=1, dtype=np.int64)
+        counts = batch_counts if counts is None else counts + batch_counts
+        done += count
+
+    matrix = counts / samples
+    deviation = np.abs(matrix - 0.5)
+    worst = np.unravel_index(np.argmax(deviation), deviation.shape)
+
+    # Each cell is Binomial(samples, 1/2) for an ideal cipher
+    expected = samples / 2
+    chi_square = float(((counts - expected) ** 2).sum() / (samples / 4))
+    dof = counts.size
+
+    return {
+        'samples': samples,
+        'input_bits': input_bits,
+        'output_bits': counts.shape[1],
+        'matrix': matrix,
+        'max_deviation': float(deviation[worst]),
+        'worst_pair': (int(worst[0]), int(worst[1])),
+        'chi_square': chi_square,
+        'degrees_of_freedom': dof,
+        'p_value': chi2_sf(chi_square, dof),
+    }
+
+def calculate_bic(cipher, key, samples=1000, seed=None):
     """
+    Bit Independence Criterion: for every input bit i, flips i over 'samples'
+    random plaintexts and measures the correlation between the changes of
+    every pair of output bits (j, k); an ideal cipher keeps them all near 0.
+
+    Per batch, the output changes are unpacked into a (plaintexts x
+    output_bits) 0/1 matrix per input bit, and the pair counts come from its
+    Gram matrix (one batched matrix product for every input bit at once).
+    Only the Gram matrices and the per-bit counts are accumulated, so memory
+    stays O(input_bits x output_bits^2) whatever the number of samples.
+    Returns the max |correlation| (the BIC score), the pair where it happens,
+    the mean |correlation| and a p-value for the max (independent bits give
+    correlations of about N(0, 1/samples), Bonferroni-corrected over all
+    pairs). Output bits that never change have no correlation and count as 0.
+    """
+    rng = np.random.default_rng(seed)
+    block_size = getattr(cipher, 'block_size', None) or 8
+    input_bits = block_size * 8
+
+    # Row i flips input bit i (MSB first, like np.unpackbits)
+    flip_masks = np.packbits(np.eye(input_bits, dtype=np.uint8), axis=1)
+
+    gram = ones = None
+    done = 0
+    while done < samples:
+        count = min(BIC_BATCH_SIZE, samples - done)
+        p1 = rng.integers(0, 256, size=(count, block_size), dtype=np.uint8)
+        p2 = (p1[None, :, :] ^ flip_masks[:, None, :]).reshape(-1, block_size)
+        c1 = encrypt_blocks(cipher, p1, key)
+        c2 = encrypt_blocks(cipher, p2, key).reshape(input_bits, count, -1)
+
+        # (input_bits, count, output_bits); float32 products of 0/1 are exact at this size
+        changed = np.unpackbits(c1[None, :, :] ^ c2, axis=2).astype(np.float32)
+        batch_gram = np.matmul(changed.transpose(0, 2, 1), changed).astype(np.float64)
+        batch_ones = changed.sum(axis=1, dtype=np.float64)
+        gram = batch_gram if gram is None else gram + batch_gram
+        ones = batch_ones if ones is None else ones + batch_ones
+        done += count
+
+    # Pearson correlation of every pair of output bit changes, per input bit
+    covariance = samples * gram - ones[:, :, None] * ones[:, None, :]
+    variance = samples * ones - ones ** 2
+    scale = np.sqrt(variance[:, :, None] * variance[:, None, :])
+    correlation = np.divide(covariance, scale, out=np.zeros_like(covariance), where=scale > 0)
+
+    # Every pair j < k once
+    output_bits = ones.shape[1]
+    first, second = np.triu_indices(output_bits, 1)
+    pairs = np.abs(correlation[:, first, second])
+    worst_input, worst_pair = np.unravel_index(np.argmax(pairs), pairs.shape)
+    max_correlation = float(pairs[worst_input, worst_pair])
+
+    return {
+        'samples': samples,
+        'input_bits': input_bits,
+        'output_bits': output_bits,
+        'max_correlation': max_correlation,
+        'mean_correlation': float(pairs.mean()),
+        'worst_pair': (int(worst_input), int(first[worst_pair]), int(second[worst_pair])),
+        'constant_bits': int((variance == 0).sum()),
+        'p_value': min(1.0, pairs.size * 2 * normal_sf(max_correlation * math.sqrt(samples))),
+    }
+
+def measure_key_setup(cipher, key):
+    """
+    Measures the key schedule cost on its own (ms per key expansion).
+    Returns None when the cipher does not expose an 'expand_key' step.
+    """
+    stats = benchmark_key_setup(cipher, key)
+    if stats is None:
+        return None
+    return stats['median_ns'] / 1e6
+
+def measure_performance(cipher, plaintext, key, trials=15, warmup=3):
+    """
+    Measures Speed (Time) and Memory (RAM) of encrypting 'plaintext'.
+    Timing and memory are separate passes, so tracemalloc does not slow the
+    timed calls. Speed is the median over the trials after warm-up.
+    See core/benchmark.py (run_benchmark) for the full message-size sweep.
+    """
+    encrypt_once = lambda: cipher.encrypt(plaintext, key)
+
+    # Measure Time (warm-up also expands/caches the key schedule)
+    samples = time_callable(encrypt_once, trials=trials, warmup=warmup)
+    avg_time_ms = statistics.median(samples) / 1e6
+
     # Measure Memory
-    tracemalloc.start()
-    
-    # Measure Time
-    start_time = time.perf_counter()
-    
-    for _ in range(iterations):
-        cipher.encrypt(plaintext, key)
-        
-    end_time = time.perf_counter()
-    current, peak = tracemalloc.get_traced_memory()
-    tracemalloc.stop()
-    
-    avg_time_ms = ((end_time - start_time) / iterations) * 1000
-    peak_memory_kb = peak / 1024
-    
-    return avg_time_ms, peak_memory_kb
\ No newline at end of file
+    peak_memory_kb = measure_peak_memory(encrypt_once)
+
+    return avg_time_ms, peak_memory_kb
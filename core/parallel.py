@@ -0,0 +1,68 @@
+# core/parallel.py
+import os
+import pickle
+
+import numpy as np
+
+from core.loader import load_custom_cipher_from_text
+from core.metrics import avalanche_partial_sums
+
+
+def make_cipher_spec(cipher):
+    """
+    Describes a cipher so that a worker process can rebuild it.
+    Picklable ciphers are sent as they are; ciphers loaded from pasted code
+    (classes created by exec() cannot be pickled) are sent as their source.
+    """
+    try:
+        pickle.dumps(cipher)
+        return ('instance', cipher)
+    except Exception:
+        source_code = getattr(cipher, 'source_code', None)
+        if source_code is None:
+            raise ValueError(f"Cipher '{cipher.name}' can neither be pickled nor rebuilt from source")
+        return ('source', source_code)
+
+
+def build_cipher(spec):
+    """Inverse of make_cipher_spec (runs inside the worker)"""
+    kind, payload = spec
+    if kind == 'source':
+        return load_custom_cipher_from_text(payload)
+    return payload
+
+
+def split_rounds(rounds, shards):
+    """Splits 'rounds' into 'shards' near-equal parts that add up exactly"""
+    base, extra = divmod(rounds, shards)
+    return [base + (1 if i < extra else 0) for i in range(shards)]
+
+
+def shard_seeds(seed, shards):
+    """One independent, deterministic seed per shard (derived from 'seed')"""
+    return np.random.SeedSequence(seed).spawn(shards)
+
+
+def avalanche_shard(spec, key, rounds, seed, tolerance=None):
+    """Worker entry point: one shard of the avalanche test"""
+    return avalanche_partial_sums(build_cipher(spec), key, rounds, seed, tolerance=tolerance)
+
+
+def submit_avalanche_shards(executor, spec, key, rounds, shards, seed=None, tolerance=None):
+    """
+    Submits the avalanche rounds as 'shards' jobs to 'executor'.
+    Returns the list of futures (merge them with merge_avalanche_sums).
+    In adaptive mode each shard stops at tolerance * sqrt(shards), which
+    makes the merged interval roughly 'tolerance' wide.
+    """
+    shards = max(1, min(shards, rounds))
+    shard_tolerance = tolerance * shards ** 0.5 if tolerance else None
+    futures = []
+    for shard_rounds, shard_seed in zip(split_rounds(rounds, shards), shard_seeds(seed, shards)):
+        futures.append(executor.submit(avalanche_shard, spec, key, shard_rounds, shard_seed, shard_tolerance))
+    return futures
+
+
+def default_workers():
+    """Number of worker processes to use when none is requested"""
+    return os.cpu_count() or 1
@@ -0,0 +1,390 @@
+# core/randomness.py
+import math
+
+import numpy as np
+
+from core.metrics import POPCOUNT_TABLE, encrypt_blocks
+from core.stats import igamc
+
+# Bytes of cipher output generated (and tested) at a time
+RANDOMNESS_CHUNK_BYTES = 1 << 20
+
+# Significance level of every test
+RANDOMNESS_ALPHA = 0.01
+
+# Bits unpacked at once by the longest run test
+LONGEST_RUN_BATCH_BITS = 1 << 20
+
+# Longest run of ones test: block size -> (runs counted in the lowest category,
+# number of categories - 1, probability of each category) (NIST SP 800-22, 2.4.4)
+LONGEST_RUN_CLASSES = {
+    8: (1, 3, (0.2148, 0.3672, 0.2305, 0.1875)),
+    128: (4, 5, (0.1174, 0.2430, 0.2493, 0.1752, 0.1027, 0.1124)),
+    10000: (10, 6, (0.0882, 0.2092, 0.2483, 0.1933, 0.1208, 0.0675, 0.0727)),
+}
+
+
+def _byte_tables():
+    # For every byte value, read MSB first as a ±1 walk: the transitions between
+    # its adjacent bits, its longest run of ones, and its sum / highest / lowest prefix sum
+    transitions, longest, total, highest, lowest = [], [], [], [], []
+    for value in range(256):
+        bits = [(value >> (7 - i)) & 1 for i in range(8)]
+        transitions.append(sum(bits[i] != bits[i + 1] for i in range(7)))
+        run = best = 0
+        for bit in bits:
+            run = run + 1 if bit else 0
+            best = max(best, run)
+        longest.append(best)
+        prefix = np.cumsum([2 * bit - 1 for bit in bits])
+        total.append(prefix[-1])
+        highest.append(prefix.max())
+        lowest.append(prefix.min())
+    return tuple(np.array(table, dtype=np.int64) for table in (transitions, longest, total, highest, lowest))
+
+
+TRANSITIONS_TABLE, LONGEST_RUN_TABLE, WALK_TOTAL, WALK_HIGHEST, WALK_LOWEST = _byte_tables()
+
+
+class MonobitTest:
+    """Frequency (monobit) test: the proportion of ones"""
+
+    def __init__(self):
+        self.bits = 0
+        self.ones = 0
+
+    def update(self, data):
+        self.bits += len(data) * 8
+        self.ones += int(POPCOUNT_TABLE[data].sum(dtype=np.int64))
+
+    def p_value(self):
+        s = 2 * self.ones - self.bits
+        return math.erfc(abs(s) / math.sqrt(2 * self.bits))
+
+
+class BlockFrequencyTest:
+    """Frequency test within blocks of 'block_bits' bits (a multiple of 8)"""
+
+    def __init__(self, block_bits=128):
+        self.block_bits = block_bits
+        self.block_bytes = block_bits // 8
+        self.blocks = 0
+        self.deviations = 0.0
+        # Ones and bytes of the block still being filled
+        self.partial_ones = 0
+        self.partial_bytes = 0
+
+    def _add_blocks(self, ones):
+        self.blocks += len(ones)
+        self.deviations += float(((np.asarray(ones) / self.block_bits - 0.5) ** 2).sum())
+
+    def update(self, data):
+        counts = POPCOUNT_TABLE[data].astype(np.int64)
+        need = self.block_bytes - self.partial_bytes
+        if len(counts) < need:
+            self.partial_ones += int(counts.sum())
+            self.partial_bytes += len(counts)
+            return
+
+        # Complete the pending block, then every whole block of the chunk
+        self._add_blocks([self.partial_ones + int(counts[:need].sum())])
+        rest = counts[need:]
+        whole = len(rest) // self.block_bytes
+        self._add_blocks(rest[:whole * self.block_bytes].reshape(whole, self.block_bytes).sum(axis=1))
+        self.partial_ones = int(rest[whole * self.block_bytes:].sum())
+        self.partial_bytes = len(rest) - whole * self.block_bytes
+
+    def p_value(self):
+        if self.blocks == 0:
+            return None
+        chi_square = 4 * self.block_bits * self.deviations
+        return igamc(self.blocks / 2, chi_square / 2)
+
+
+class RunsTest:
+    """Runs test: the number of runs of identical bits"""
+
+    def __init__(self):
+        self.bits = 0
+        self.ones = 0
+        self.transitions = 0
+        self.last_byte = None
+
+    def update(self, data):
+        if len(data) == 0:
+            return
+        self.bits += len(data) * 8
+        self.ones += int(POPCOUNT_TABLE[data].sum(dtype=np.int64))
+
+        # Inside every byte, then between the last bit of a byte and the first of the next
+        self.transitions += int(TRANSITIONS_TABLE[data].sum())
+        self.transitions += int(np.count_nonzero((data[:-1] & 1) != (data[1:] >> 7)))
+        if self.last_byte is not None:
+            self.transitions += int((self.last_byte & 1) != (data[0] >> 7))
+        self.last_byte = int(data[-1])
+
+    def p_value(self):
+        pi = self.ones / self.bits
+        # Prerequisite frequency test
+        if abs(pi - 0.5) >= 2 / math.sqrt(self.bits):
+            return 0.0
+        runs = self.transitions + 1
+        expected = 2 * self.bits * pi * (1 - pi)
+        return math.erfc(abs(runs - expected) / (2 * math.sqrt(2 * self.bits) * pi * (1 - pi)))
+
+
+class LongestRunTest:
+    """Longest run of ones in blocks of 8, 128 or 10000 bits"""
+
+    def __init__(self, block_bits=10000):
+        self.block_bits = block_bits
+        self.block_bytes = block_bits // 8
+        self.lowest, self.top_class, self.probabilities = LONGEST_RUN_CLASSES[block_bits]
+        self.classes = np.zeros(self.top_class + 1, dtype=np.int64)
+        self.pending = np.zeros(0, dtype=np.uint8)
+
+    def update(self, data):
+        data = np.concatenate([self.pending, data])
+        whole = len(data) // self.block_bytes
+        self.pending = data[whole * self.block_bytes:]
+        if whole == 0:
+            return
+
+        if self.block_bytes == 1:
+            self._add_runs(LONGEST_RUN_TABLE[data[:whole]])
+            return
+        # A few blocks at a time, so the unpacked bits stay small
+        step = max(1, LONGEST_RUN_BATCH_BITS // self.block_bits) * self.block_bytes
+        for start in range(0, whole * self.block_bytes, step):
+            bits = np.unpackbits(data[start:min(start + step, whole * self.block_bytes)])
+            self._add_runs(longest_runs(bits.reshape(-1, self.block_bits)))
+
+    def _add_runs(self, longest):
+        classes = np.clip(longest - self.lowest, 0, self.top_class)
+        self.classes += np.bincount(classes, minlength=self.top_class + 1)
+
+    def p_value(self):
+        blocks = int(self.classes.sum())
+        if blocks == 0:
+            return None
+        expected = blocks * np.array(self.probabilities)
+        chi_square = float(((self.classes - expected) ** 2 / expected).sum())
+        return igamc(self.top_class / 2, chi_square / 2)
+
+
+def longest_runs(bits):
+    """Longest run of ones of every row of a 2D 0/1 array"""
+    padded = np.zeros((bits.shape[0], bits.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = bits
+    edges = np.diff(padded, axis=1)
+    # Row-major order pairs every run start with its end
+    start_rows, start_cols = np.nonzero(edges == 1)
+    _, end_cols = np.nonzero(edges == -1)
+    longest = np.zeros(bits.shape[0], dtype=np.int64)
+    np.maximum.at(longest, start_rows, end_cols - start_cols)
+    return longest
+
+
+class CumulativeSumsTest:
+    """Cumulative sums test, forward and backward (the bits as a ±1 random walk)"""
+
+    def __init__(self):
+        self.bits = 0
+        self.total = 0
+        # Extremes of the walk's prefix sums (S_0 = 0 included)
+        self.highest = 0
+        self.lowest = 0
+
+    def update(self, data):
+        if len(data) == 0:
+            return
+        self.bits += len(data) * 8
+        ends = self.total + np.cumsum(WALK_TOTAL[data])
+        starts = ends - WALK_TOTAL[data]
+        self.highest = max(self.highest, int((starts + WALK_HIGHEST[data]).max()))
+        self.lowest = min(self.lowest, int((starts + WALK_LOWEST[data]).min()))
+        self.total = int(ends[-1])
+
+    def p_values(self):
+        forward = max(self.highest, -self.lowest)
+        # The backward walk's partial sums are S_n - S_j
+        backward = max(self.total - self.lowest, self.highest - self.total)
+        return cusum_p_value(forward, self.bits), cusum_p_value(backward, self.bits)
+
+
+def cusum_p_value(z, n):
+    """P-value of a cumulative sums excursion 'z' over n bits (NIST SP 800-22, 2.13.4)"""
+    sqrt_n = math.sqrt(n)
+
+    def phi(x):
+        return 0.5 * math.erfc(-x / math.sqrt(2))
+
+    # Terms far in the tails are zero, so the sums only go a few standard deviations out
+    limit = int(10 * sqrt_n / z) + 2
+    first = range(max(int((-n / z + 1) / 4), -limit), min(int((n / z - 1) / 4), limit) + 1)
+    second = range(max(int((-n / z - 3) / 4), -limit), min(int((n / z - 1) / 4), limit) + 1)
+    sum1 = sum(phi((4 * k + 1) * z / sqrt_n) - phi((4 * k - 1) * z / sqrt_n) for k in first)
+    sum2 = sum(phi((4 * k + 3) * z / sqrt_n) - phi((4 * k + 1) * z / sqrt_n) for k in second)
+    return min(1.0, max(0.0, 1 - sum1 + sum2))
+
+
+class OverlappingPatterns:
+    """
+    Counts of every overlapping 'pattern_bits'-bit pattern of the stream, read
+    circularly (the end wraps to the start), for the approximate entropy and
+    serial tests. Shorter patterns are marginals of these counts.
+
+    Patterns are read from 32-bit words starting at every byte, one bit
+    offset at a time, so 'pattern_bits' can be up to 25.
+    """
+
+    def __init__(self, pattern_bits=17):
+        self.pattern_bits = pattern_bits
+        self.counts = np.zeros(1 << pattern_bits, dtype=np.int64)
+        self.bits = 0
+        # The first bytes (for the wrap-around) and the last ones, whose patterns need the next chunk
+        self.head = np.zeros(0, dtype=np.uint8)
+        self.pending = np.zeros(0, dtype=np.uint8)
+
+    def _count(self, data):
+        data = data.astype(np.uint32)
+        words = (data[:-3] << 24) | (data[1:-2] << 16) | (data[2:-1] << 8) | data[3:]
+        mask = np.uint32((1 << self.pattern_bits) - 1)
+        for offset in range(8):
+            patterns = (words >> np.uint32(32 - self.pattern_bits - offset)) & mask
+            self.counts += np.bincount(patterns, minlength=len(self.counts))
+
+    def update(self, data):
+        self.bits += len(data) * 8
+        if len(self.head) < 3:
+            self.head = np.concatenate([self.head, data[:3 - len(self.head)]])
+        data = np.concatenate([self.pending, data])
+        if len(data) > 3:
+            self._count(data)
+        self.pending = data[-3:]
+
+    def finish(self):
+        # The patterns of the last bytes wrap around to the first ones
+        self._count(np.concatenate([self.pending, self.head]))
+        self.pending = np.zeros(0, dtype=np.uint8)
+
+    def pattern_counts(self, bits):
+        if bits <= 0:
+            return np.array([self.bits])
+        return self.counts.reshape(1 << bits, -1).sum(axis=1)
+
+    def approximate_entropy_p_value(self, m):
+        def phi(bits):
+            frequencies = self.pattern_counts(bits) / self.bits
+            frequencies = frequencies[frequencies > 0]
+            return float((frequencies * np.log(frequencies)).sum())
+
+        apen = phi(m) - phi(m + 1)
+        chi_square = 2 * self.bits * (math.log(2) - apen)
+        return igamc(2 ** (m - 1), chi_square / 2)
+
+    def serial_p_values(self, m):
+        def psi_square(bits):
+            if bits <= 0:
+                return 0.0
+            counts = self.pattern_counts(bits).astype(np.float64)
+            return float((2 ** bits / self.bits) * (counts ** 2).sum() - self.bits)
+
+        psi = [psi_square(m), psi_square(m - 1), psi_square(m - 2)]
+        delta = psi[0] - psi[1]
+        delta2 = psi[0] - 2 * psi[1] + psi[2]
+        return igamc(2 ** (m - 2), delta / 2), igamc(2 ** (m - 3), delta2 / 2)
+
+
+class RandomnessBattery:
+    """
+    NIST SP 800-22 style tests over a byte stream fed one chunk at a time:
+    monobit, block frequency, runs, longest run, cumulative sums,
+    approximate entropy and serial. Every test keeps running totals only,
+    so memory does not grow with the stream. 'total_bits' (the expected
+    stream length) picks the block and pattern sizes NIST recommends for it.
+    """
+
+    def __init__(self, total_bits=8 * RANDOMNESS_CHUNK_BYTES):
+        log_n = int(math.log2(max(total_bits, 2)))
+        self.apen_bits = max(2, min(10, log_n - 6))
+        self.serial_bits = max(3, min(16, log_n - 3))
+
+        # Block frequency: fewer than 100 blocks of at least 128 bits
+        block_bits = max(128, 8 * (total_bits // 800 + 1))
+        run_bits = 8 if total_bits < 6272 else 128 if total_bits < 750000 else 10000
+
+        self.monobit = MonobitTest()
+        self.block_frequency = BlockFrequencyTest(block_bits)
+        self.runs = RunsTest()
+        self.longest_run = LongestRunTest(run_bits)
+        self.cusum = CumulativeSumsTest()
+        self.patterns = OverlappingPatterns(max(self.apen_bits + 1, self.serial_bits))
+        self.accumulators = (self.monobit, self.block_frequency, self.runs, self.longest_run,
+                             self.cusum, self.patterns)
+
+    def update(self, data):
+        data = np.frombuffer(data, dtype=np.uint8) if not isinstance(data, np.ndarray) else data.ravel()
+        for accumulator in self.accumulators:
+            accumulator.update(data)
+
+    def p_values(self):
+        self.patterns.finish()
+        cusum_forward, cusum_backward = self.cusum.p_values()
+        serial_1, serial_2 = self.patterns.serial_p_values(self.serial_bits)
+        return {
+            'monobit': self.monobit.p_value(),
+            'block_frequency': self.block_frequency.p_value(),
+            'runs': self.runs.p_value(),
+            'longest_run': self.longest_run.p_value(),
+            'cusum_forward': cusum_forward,
+            'cusum_backward': cusum_backward,
+            'approximate_entropy': self.patterns.approximate_entropy_p_value(self.apen_bits),
+            'serial_1': serial_1,
+            'serial_2': serial_2,
+        }
+
+
+def counter_mode_stream(cipher, key, total_bytes, chunk_bytes=RANDOMNESS_CHUNK_BYTES):
+    """
+    Ciphertext of the counter blocks 0, 1, 2, ... (big-endian, in the low
+    bytes of each block), yielded as uint8 chunks of about 'chunk_bytes'
+    until 'total_bytes' have been produced.
+    """
+    block_size = getattr(cipher, 'block_size', None) or 8
+    counter_bytes = min(8, block_size)
+    blocks_per_chunk = max(1, chunk_bytes // block_size)
+
+    counter = produced = 0
+    while produced < total_bytes:
+        counters = np.arange(counter, counter + blocks_per_chunk, dtype=np.uint64)
+        blocks = np.zeros((blocks_per_chunk, block_size), dtype=np.uint8)
+        blocks[:, block_size - counter_bytes:] = counters.astype('>u8').view(np.uint8).reshape(-1, 8)[:, 8 - counter_bytes:]
+        chunk = encrypt_blocks(cipher, blocks, key).ravel()[:total_bytes - produced]
+        counter += blocks_per_chunk
+        produced += len(chunk)
+        yield chunk
+
+
+def stream_randomness(chunks, total_bits):
+    """Runs the battery over an iterable of byte chunks (any keystream)"""
+    battery = RandomnessBattery(total_bits)
+    for chunk in chunks:
+        battery.update(chunk)
+    return battery.p_values()
+
+
+def calculate_randomness(cipher, key, total_bytes, chunk_bytes=RANDOMNESS_CHUNK_BYTES, alpha=RANDOMNESS_ALPHA):
+    """
+    Runs the randomness battery over 'total_bytes' of counter-mode
+    ciphertext. Returns the p-value of every test and how many pass at 'alpha'.
+    """
+    p_values = stream_randomness(counter_mode_stream(cipher, key, total_bytes, chunk_bytes), total_bytes * 8)
+    scored = [p for p in p_values.values() if p is not None]
+    return {
+        'bytes': total_bytes,
+        'p_values': p_values,
+        'passed': sum(p >= alpha for p in scored),
+        'tests': len(scored),
+        'alpha': alpha,
+    }
@@ -0,0 +1,321 @@
+# core/sandbox.py
+import importlib
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import Future
+
+try:
+    import resource
+except ImportError:  # not available on Windows: workers then run without rlimits
+    resource = None
+
+# Worker processes, and the limits every job runs under
+SANDBOX_WORKERS = int(os.environ.get("CIPHERSCORE_SANDBOX_WORKERS", min(4, os.cpu_count() or 1)))
+SANDBOX_MEMORY_MB = int(os.environ.get("CIPHERSCORE_SANDBOX_MEMORY_MB", 2048))
+SANDBOX_CPU_SECONDS = int(os.environ.get("CIPHERSCORE_SANDBOX_CPU_SECONDS", 300))
+SANDBOX_TIMEOUT = float(os.environ.get("CIPHERSCORE_SANDBOX_TIMEOUT", 600))
+
+# Largest message (result or progress event) a worker may send, in bytes
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+# Seconds a new worker gets to import its modules and report ready
+WORKER_START_TIMEOUT = 60
+
+# Imported before any job, so a job never pays for them
+SANDBOX_PRELOAD = ('numpy', 'core.agent', 'core.loader', 'core.parallel')
+
+
+class SandboxError(Exception):
+    """
+    A sandboxed job failed: it raised, timed out, hit a limit or crashed its
+    worker. When the job raised, error_type is the name of its exception class.
+    """
+
+    def __init__(self, message, error_type=None):
+        super().__init__(message)
+        self.error_type = error_type
+
+
+def _send(conn, kind, payload):
+    # Workers answer in JSON: the parent must never unpickle what untrusted code sent
+    conn.send_bytes(json.dumps([kind, payload]).encode('utf-8'))
+
+
+class _PipeProgress:
+    # Stands in for a progress queue inside the worker: events go up the job's pipe
+    def __init__(self, conn):
+        self.conn = conn
+
+    def put(self, event):
+        if event is not None:
+            _send(self.conn, 'progress', event)
+
+
+def _worker_main(conn, preload, memory_mb, cpu_seconds):
+    # Own process group, so killing the worker also kills whatever a job started
+    os.setsid()
+    for module in preload:
+        importlib.import_module(module)
+
+    if resource is not None:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    try:
+        _send(conn, 'ready', os.getpid())
+    except OSError:
+        return  # the pool went away while we were starting
+    try:
+        message = conn.recv()
+    except EOFError:
+        return
+    if message is None:
+        return
+
+    func, args, with_progress = message
+    if resource is not None:
+        # The job's CPU seconds start now: SIGXCPU at the soft limit, SIGKILL a second later
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft = int(usage.ru_utime + usage.ru_stime) + cpu_seconds
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, soft + 1))
+
+    try:
+        if with_progress:
+            args = args + (_PipeProgress(conn),)
+        _send(conn, 'result', func(*args))
+    except MemoryError:
+        _send(conn, 'fatal', f"Memory limit exceeded ({memory_mb} MB)")
+    except BaseException as e:
+        try:
+            _send(conn, 'error', [type(e).__name__, str(e) or type(e).__name__])
+        except Exception:
+            pass
+
+
+class _Worker:
+    # Parent side of one worker process
+
+    def __init__(self, context, preload, memory_mb, cpu_seconds):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, daemon=False,
+                                       args=(child_conn, preload, memory_mb, cpu_seconds))
+        self.process.start()
+        child_conn.close()
+
+    def wait_ready(self):
+        if not self.conn.poll(WORKER_START_TIMEOUT):
+            raise SandboxError("Sandbox worker did not start")
+        try:
+            self.conn.recv_bytes(MAX_MESSAGE_BYTES)
+        except (EOFError, OSError):
+            raise SandboxError("Sandbox worker died while starting")
+
+    def kill(self):
+        self.signal_kill()
+        self.process.join()
+        self.conn.close()
+
+    def signal_kill(self):
+        # The whole group, since a job may have started processes of its own
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            self.process.kill()
+
+    def death_reason(self):
+        self.process.join(timeout=1)
+        code = self.process.exitcode
+        if code == -signal.SIGXCPU:
+            return "CPU time limit exceeded"
+        if code == -signal.SIGKILL:
+            return "Worker was killed (out of memory?)"
+        return f"Worker crashed (exit code {code})"
+
+
+class SandboxPool:
+    """
+    Pre-forked worker processes for untrusted code (pasted ciphers).
+    Every worker has core and NumPy imported before its first job and runs
+    under rlimits on address space and CPU time; the pool adds a wall-clock
+    timeout per job. Every worker runs a single job and is then killed
+    (with any process or thread the job left behind), so one job can never
+    see or change the next one; its replacement is forked right away.
+    Workers answer in JSON, so results must be JSON-serializable.
+    """
+
+    def __init__(self, workers=SANDBOX_WORKERS, memory_mb=SANDBOX_MEMORY_MB, cpu_seconds=SANDBOX_CPU_SECONDS,
+                 timeout=SANDBOX_TIMEOUT, preload=SANDBOX_PRELOAD):
+        self.workers = workers
+        self.memory_mb = memory_mb
+        self.cpu_seconds = cpu_seconds
+        self.timeout = timeout
+        self.preload = tuple(dict.fromkeys(m for m in preload if m != '__main__'))
+
+        # forkserver: workers are forked from a clean single-threaded process, not from
+        # the threaded API process. Its preload list is process-wide, so it is left alone:
+        # each worker imports the preload modules itself, before it reports ready
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            self._context = multiprocessing.get_context('forkserver')
+        else:
+            self._context = multiprocessing.get_context()
+
+        self._jobs = queue.Queue()
+        self._closed = False
+        self._running = set()
+        self._lock = threading.Lock()
+        self._slots = [threading.Thread(target=self._run_slot, daemon=True) for _ in range(workers)]
+        for slot in self._slots:
+            slot.start()
+
+    def submit(self, func, *args, on_progress=None, timeout=None):
+        """
+        Runs func(*args) in a worker and returns a Future. func and args must
+        be picklable, the result JSON-serializable. With on_progress, a queue-like object is appended to the
+        arguments and every event put on it is passed to on_progress.
+        """
+        future = Future()
+        # Under the lock, so a job is never queued behind shutdown()'s sentinels
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Sandbox pool is shut down")
+            self._jobs.put((future, func, args, on_progress, timeout or self.timeout))
+        return future
+
+    def _start_worker(self):
+        try:
+            worker = _Worker(self._context, self.preload, self.memory_mb, self.cpu_seconds)
+        except Exception as e:
+            raise SandboxError(f"Sandbox worker could not be started: {e}")
+        try:
+            worker.wait_ready()
+        except SandboxError:
+            worker.kill()
+            raise
+        with self._lock:
+            if not self._closed:
+                self._running.add(worker)
+                return worker
+        # shutdown() did not see this one
+        worker.kill()
+        raise SandboxError("Sandbox pool is shut down")
+
+    def _retire(self, worker):
+        with self._lock:
+            self._running.discard(worker)
+        worker.kill()
+
+    def _run_slot(self):
+        # One thread per worker: feeds it jobs and watches it
+        worker = None
+        try:
+            worker = self._start_worker()
+        except SandboxError:
+            pass  # retried when the first job comes in
+
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            future, func, args, on_progress, timeout = job
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                if worker is not None and not worker.process.is_alive():
+                    self._retire(worker)
+                    worker = None
+                if worker is None:
+                    worker = self._start_worker()
+                worker.conn.send((func, args, on_progress is not None))
+            except SandboxError as e:
+                future.set_exception(e)
+                continue
+            except Exception as e:
+                # Unpicklable job: the worker never saw it
+                future.set_exception(SandboxError(f"Job can not be sent to the sandbox: {e}"))
+                continue
+
+            # One job per worker: whatever this one left behind dies with it
+            self._wait(worker, future, on_progress, timeout)
+            self._retire(worker)
+            worker = None
+            if not self._closed:
+                try:
+                    worker = self._start_worker()
+                except SandboxError:
+                    pass
+
+        if worker is not None:
+            self._retire(worker)
+
+    def _wait(self, worker, future, on_progress, timeout):
+        # Relays the job's messages until it ends (or its worker does)
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                future.set_exception(SandboxError(f"Timed out after {timeout:g} s"))
+                return
+            try:
+                if not worker.conn.poll(min(remaining, 1.0)):
+                    if not worker.process.is_alive() and not worker.conn.poll():
+                        future.set_exception(self._death_error(worker))
+                        return
+                    continue
+                kind, payload = json.loads(worker.conn.recv_bytes(MAX_MESSAGE_BYTES))
+                if kind == 'error':
+                    error_type, message = payload
+            except EOFError:
+                future.set_exception(self._death_error(worker))
+                return
+            except (OSError, ValueError, TypeError) as e:
+                # Too long, not JSON or not a (kind, payload) pair
+                future.set_exception(SandboxError(f"Unreadable message from the sandbox: {e}"))
+                return
+
+            if kind == 'progress':
+                if on_progress is not None:
+                    on_progress(payload)
+            elif kind == 'result':
+                future.set_result(payload)
+                return
+            elif kind == 'error':
+                future.set_exception(SandboxError(str(message), error_type=str(error_type)))
+                return
+            else:
+                future.set_exception(SandboxError(str(payload)))
+                return
+
+    def _death_error(self, worker):
+        if self._closed:
+            return SandboxError("Sandbox pool is shut down")
+        return SandboxError(worker.death_reason())
+
+    def shutdown(self):
+        """Stops the workers; running and waiting jobs fail. Calling it again does nothing."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            running = list(self._running)
+
+        while True:
+            try:
+                job = self._jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None and job[0].set_running_or_notify_cancel():
+                job[0].set_exception(SandboxError("Sandbox pool is shut down"))
+        # One sentinel per slot: each slot thread stops at its next job
+        for _ in self._slots:
+            self._jobs.put(None)
+        # Every live worker is killed, idle or busy: a running job fails with its worker.
+        # Only signalled here; its slot thread joins it and closes its pipe
+        for worker in running:
+            if worker.process.is_alive():
+                worker.signal_kill()
@@ -0,0 +1,187 @@
+# core/spn.py
+import numpy as np
+
+from core.interfaces import BaseCipher, to_block_array
+
+
+def make_bit_tables(bit_map, num_bits):
+    """
+    Compiles a bit permutation (bit i -> bit_map[i], bit 0 = LSB) into one
+    256 entry table per byte of the state: table[i][v] is where the bits of
+    byte value v, placed at byte i, end up. OR the lookups of every byte.
+    """
+    tables = np.zeros(((num_bits + 7) // 8, 256), dtype=np.uint64)
+    for byte in range(len(tables)):
+        for value in range(1, 256):
+            # reuse the entry without the lowest set bit, then add that bit
+            bit = byte * 8 + (value & -value).bit_length() - 1
+            image = np.uint64(1 << bit_map[bit]) if bit < num_bits else np.uint64(0)
+            tables[byte, value] = tables[byte, value & (value - 1)] | image
+    return tables
+
+
+class SPNSpec:
+    """
+    Declarative description of a substitution-permutation network:
+    one S-box (list of 2^sbox_bits outputs) used across the whole block, a
+    bit permutation (pbox[i] = where bit i goes, bit 0 = LSB) and the number
+    of rounds. Rounds follow Heys' tutorial: key mixing, S-boxes and P-box,
+    except the last one, which has no P-box and ends with an extra key mixing.
+
+    The key schedule gets the key bytes and returns rounds + 1 round keys
+    (ints). The default one slices the key into consecutive block-sized
+    round keys, repeating the key when it is too short.
+    """
+
+    def __init__(self, name, sbox, pbox, block_bits, rounds, key_schedule=None):
+        self.name = name
+        self.sbox = list(sbox)
+        self.pbox = list(pbox)
+        self.block_bits = block_bits
+        self.rounds = rounds
+        self.key_schedule = key_schedule
+
+        self.sbox_bits = (len(self.sbox) - 1).bit_length()
+        if len(self.sbox) != 1 << self.sbox_bits or sorted(self.sbox) != list(range(len(self.sbox))):
+            raise ValueError("The S-box must be a permutation of 0 .. 2^n - 1")
+        if sorted(self.pbox) != list(range(block_bits)):
+            raise ValueError(f"The P-box must be a permutation of the {block_bits} block bits")
+        if block_bits % self.sbox_bits != 0:
+            raise ValueError(f"A {block_bits}-bit block can not be split into {self.sbox_bits}-bit S-boxes")
+        if block_bits % 8 != 0 or block_bits > 64:
+            raise ValueError("Only whole-byte blocks of up to 64 bits are supported")
+
+        self.num_sboxes = block_bits // self.sbox_bits
+        self.block_size = block_bits // 8
+
+        self.inv_sbox = [0] * len(self.sbox)
+        for x, y in enumerate(self.sbox):
+            self.inv_sbox[y] = x
+        self.inv_pbox = [0] * block_bits
+        for bit, target in enumerate(self.pbox):
+            self.inv_pbox[target] = bit
+
+        # Lookup tables of the batch path
+        self.sbox_table = np.array(self.sbox, dtype=np.uint64)
+        self.inv_sbox_table = np.array(self.inv_sbox, dtype=np.uint64)
+        self.pbox_tables = make_bit_tables(self.pbox, block_bits)
+        self.inv_pbox_tables = make_bit_tables(self.inv_pbox, block_bits)
+
+    # --- Scalar helpers (the callbacks of the cryptanalysis libraries) ---
+
+    def substitute(self, x):
+        return self.sbox[x]
+
+    def inverse_substitute(self, x):
+        return self.inv_sbox[x]
+
+    def permute(self, state):
+        result = 0
+        for table in self.pbox_tables:
+            result |= int(table[state & 0xff])
+            state >>= 8
+        return result
+
+    def round_keys(self, key):
+        """The rounds + 1 round keys of 'key' (bytes)"""
+        if self.key_schedule is not None:
+            return list(self.key_schedule(key))
+        needed = (self.rounds + 1) * self.block_size
+        material = bytes(key) * (-(-needed // max(1, len(key))))
+        return [int.from_bytes(material[i:i + self.block_size], 'big')
+                for i in range(0, needed, self.block_size)]
+
+    def differential_config(self, num_pairs=5000, min_prob=1, max_blocks_to_bf=2):
+        """
+        Arguments for differential_cryptanalysis_lib.initialize() /
+        DifferentialAnalyzer describing this SPN.
+        """
+        return (num_pairs, self.sbox_bits, self.num_sboxes, self.rounds, min_prob, max_blocks_to_bf,
+                self.substitute, self.inverse_substitute, self.permute)
+
+    # --- Batch layers (uint64 arrays, one block per element) ---
+
+    def _sbox_layer(self, state, table):
+        mask = np.uint64((1 << self.sbox_bits) - 1)
+        result = np.zeros_like(state)
+        for i in range(self.num_sboxes):
+            shift = np.uint64(i * self.sbox_bits)
+            result |= table[((state >> shift) & mask).astype(np.intp)] << shift
+        return result
+
+    def _pbox_layer(self, state, tables):
+        result = np.zeros_like(state)
+        for i, table in enumerate(tables):
+            result |= table[((state >> np.uint64(8 * i)) & np.uint64(0xff)).astype(np.intp)]
+        return result
+
+    def encrypt_words(self, state, round_keys):
+        for r in range(self.rounds - 1):
+            state = state ^ np.uint64(round_keys[r])
+            state = self._sbox_layer(state, self.sbox_table)
+            state = self._pbox_layer(state, self.pbox_tables)
+        state = state ^ np.uint64(round_keys[-2])
+        state = self._sbox_layer(state, self.sbox_table)
+        return state ^ np.uint64(round_keys[-1])
+
+    def decrypt_words(self, state, round_keys):
+        state = state ^ np.uint64(round_keys[-1])
+        state = self._sbox_layer(state, self.inv_sbox_table)
+        state = state ^ np.uint64(round_keys[-2])
+        for r in range(self.rounds - 2, -1, -1):
+            state = self._pbox_layer(state, self.inv_pbox_tables)
+            state = self._sbox_layer(state, self.inv_sbox_table)
+            state = state ^ np.uint64(round_keys[r])
+        return state
+
+    def blocks_to_words(self, blocks):
+        """(n, block_size) uint8 big-endian blocks -> uint64 array"""
+        padded = np.zeros((len(blocks), 8), dtype=np.uint8)
+        padded[:, 8 - self.block_size:] = blocks
+        return padded.view('>u8').ravel().astype(np.uint64)
+
+    def words_to_blocks(self, words):
+        """Inverse of blocks_to_words"""
+        raw = words.astype('>u8').view(np.uint8).reshape(len(words), 8)
+        return raw[:, 8 - self.block_size:].copy()
+
+
+class SPNCipher(BaseCipher):
+    """
+    BaseCipher compiled from an SPNSpec, with table-driven batch
+    encryption. Subclasses set 'spn' (so they can be registered by class),
+    or an instance is built with SPNCipher(spn).
+    """
+
+    spn = None
+
+    def __init__(self, spn=None):
+        if spn is not None:
+            self.spn = spn
+        if self.spn is None:
+            raise ValueError("SPNCipher needs an SPNSpec")
+        self.block_size = self.spn.block_size
+
+    @property
+    def name(self):
+        return self.spn.name
+
+    def expand_key(self, key):
+        return self.spn.round_keys(key)
+
+    def encrypt(self, plaintext, key):
+        block = plaintext.ljust(self.block_size, b'\0')[:self.block_size]
+        return self.encrypt_batch(block, key).tobytes()
+
+    def decrypt(self, ciphertext, key):
+        block = ciphertext.ljust(self.block_size, b'\0')[:self.block_size]
+        return self.decrypt_batch(block, key).tobytes()
+
+    def encrypt_batch(self, blocks, key):
+        # Vectorized path: the whole batch goes through each layer at once
+        words = self.spn.blocks_to_words(to_block_array(blocks, self.block_size))
+        return self.spn.words_to_blocks(self.spn.encrypt_words(words, self.spn.round_keys(key)))
+
+    def decrypt_batch(self, blocks, key):
+        words = self.spn.blocks_to_words(to_block_array(blocks, self.block_size))
+        return self.spn.words_to_blocks(self.spn.decrypt_words(words, self.spn.round_keys(key)))
@@ -0,0 +1,86 @@
+# core/stats.py
+import math
+
+# Precision / iteration limits of the incomplete gamma evaluation
+_EPS = 1e-15
+_MAX_ITER = 10000
+
+
+def igamc(a, x):
+    """
+    Regularized upper incomplete gamma function Q(a, x)
+    (the 'igamc' used by the NIST SP 800-22 tests).
+    """
+    if x <= 0:
+        return 1.0
+    if a <= 0:
+        return 0.0
+    if x < a + 1:
+        return 1.0 - _igam_series(a, x)
+    return _igamc_continued_fraction(a, x)
+
+
+def igam(a, x):
+    """Regularized lower incomplete gamma function P(a, x)"""
+    if x <= 0:
+        return 0.0
+    if a <= 0:
+        return 1.0
+    # The series keeps its precision for tiny results, 1 - Q(a, x) would not
+    if x < a + 1:
+        return _igam_series(a, x)
+    return 1.0 - _igamc_continued_fraction(a, x)
+
+
+def _igam_series(a, x):
+    # P(a, x) by its power series (converges fast for x < a + 1)
+    term = total = 1.0 / a
+    n = a
+    for _ in range(_MAX_ITER):
+        n += 1
+        term *= x / n
+        total += term
+        if abs(term) < abs(total) * _EPS:
+            break
+    return total * math.exp(-x + a * math.log(x) - math.lgamma(a))
+
+
+def _igamc_continued_fraction(a, x):
+    # Q(a, x) by Lentz's continued fraction (converges fast for x >= a + 1)
+    tiny = 1e-300
+    b = x + 1 - a
+    c = 1 / tiny
+    d = 1 / b
+    h = d
+    for i in range(1, _MAX_ITER):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        if abs(d) < tiny:
+            d = tiny
+        c = b + an / c
+        if abs(c) < tiny:
+            c = tiny
+        d = 1 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < _EPS:
+            break
+    return h * math.exp(-x + a * math.log(x) - math.lgamma(a))
+
+
+def chi2_sf(x, df):
+    """P(X >= x) for a chi-square variable with 'df' degrees of freedom"""
+    return igamc(df / 2, x / 2)
+
+
+def poisson_sf(k, mean):
+    """P(X >= k) for a Poisson variable of the given mean"""
+    if k <= 0:
+        return 1.0
+    return igam(k, mean)
+
+
+def normal_sf(z):
+    """P(Z >= z) for a standard normal variable"""
+    return 0.5 * math.erfc(z / math.sqrt(2))
@@ -13,6 +13,7 @@ function App() {
   const [customCode, setCustomCode] = useState(defaultCustomCode);
   const [report, setReport] = useState(null);
   const [loading, setLoading] = useState(false);
+  const [progress, setProgress] = useState(null);
   const [error, setError] = useState(null);
 
   useEffect(() => {
@@ -32,13 +33,15 @@ function App() {
     setLoading(true);
     setError(null);
     setReport(null);
+    setProgress(null);
     try {
-      const data = await runAudit(selectedCipher, customCode, rounds);
+      const data = await runAudit(selectedCipher, customCode, rounds, setProgress);
       setReport(data.report);
     } catch (err) {
       setError(err.response?.data?.detail || "Audit failed due to network or server error.");
     } finally {
       setLoading(false);
+      setProgress(null);
     }
   };
 
@@ -74,7 +77,7 @@ function App() {
           >
             {loading ? (
               <span className="btn-icon">
-                <Activity style={{ width: 20, height: 20 }} className="spin" /> Auditing...
+                <Activity style={{ width: 20, height: 20 }} className="spin" /> {formatProgress(progress)}
               </span>
             ) : (
               <span className="btn-icon">
@@ -127,6 +130,16 @@ function App() {
   );
 }
 
+const formatProgress = (progress) => {
+  if (!progress) return 'Auditing...';
+  if (progress.stage === 'avalanche' && progress.rounds_total) {
+    const percent = Math.round((100 * progress.rounds_completed) / progress.rounds_total);
+    const estimate = progress.avalanche_estimate !== undefined ? ` · ${progress.avalanche_estimate.toFixed(2)}%` : '';
+    return `Avalanche ${percent}%${estimate}`;
+  }
+  return `Running ${progress.stage}...`;
+};
+
 const defaultCustomCode = `class MyCustomCipher:
     @property
     def name(self):
@@ -19,7 +19,7 @@ export const getCiphers = async () => {
   }
 };
 
-export const runAudit = async (cipherId, customCode, rounds) => {
+export const runAudit = async (cipherId, customCode, rounds, onProgress) => {
   try {
     const payload = {
       cipher_id: cipherId,
@@ -30,10 +30,36 @@ export const runAudit = async (cipherId, customCode, rounds) => {
       payload.custom_code = customCode;
     }
 
-    const response = await api.post('/audit', payload);
-    return response.data;
+    // Queue the audit, then follow its progress over Server-Sent Events
+    const response = await api.post('/audits', payload);
+    return await waitForAudit(response.data.job_id, onProgress);
   } catch (error) {
     console.error('Error running audit:', error);
     throw error;
   }
 };
+
+const waitForAudit = (jobId, onProgress) =>
+  new Promise((resolve, reject) => {
+    const source = new EventSource(`${API_BASE_URL}/audits/${jobId}/events`);
+
+    source.addEventListener('progress', (event) => {
+      if (onProgress) onProgress(JSON.parse(event.data));
+    });
+
+    source.addEventListener('finished', (event) => {
+      source.close();
+      resolve(JSON.parse(event.data).result);
+    });
+
+    source.addEventListener('failed', (event) => {
+      source.close();
+      const job = JSON.parse(event.data);
+      reject({ response: { data: { detail: `Audit failed: ${job.error}` } } });
+    });
+
+    source.onerror = () => {
+      source.close();
+      reject(new Error('Lost connection to the audit event stream.'));
+    };
+  });
@@ -0,0 +1,52 @@
+# tests/test_cache.py
+from core.cache import AuditResultCache, cached_full_audit
+
+
+class FakeAgent:
+    # Stands in for CipherAuditAgent: a fixed report, counting what ran
+    def __init__(self):
+        self.results = {}
+        self.full_audits = 0
+        self.performance_runs = 0
+
+    def run_full_audit(self, **kwargs):
+        self.full_audits += 1
+        self.results = {
+            'Avalanche Score': '50.00%',
+            'Differential Attack': {'stopped_by': None, 'key_recovered': True, 'time_spent': 1.5},
+        }
+        self.run_performance_stage()
+        return self.results
+
+    def run_performance_stage(self):
+        self.performance_runs += 1
+        self.results['Encryption Speed (ms)'] = f"{self.performance_runs:.4f} ms"
+
+
+def test_expired_timing_keeps_attack_time(tmp_path):
+    cache = AuditResultCache(path=str(tmp_path / "audits.sqlite3"), timing_ttl=0)
+    agent = FakeAgent()
+
+    first = cached_full_audit(cache, "key", agent)
+    assert first['Differential Attack']['time_spent'] == 1.5
+
+    # Timings expire at once: only the performance stage runs again
+    second = cached_full_audit(cache, "key", agent)
+    assert agent.full_audits == 1
+    assert agent.performance_runs == 2
+    assert second['Encryption Speed (ms)'] == "2.0000 ms"
+    assert second['Differential Attack']['time_spent'] == 1.5
+
+    # ...and the refreshed entry still holds the attack time
+    third = cached_full_audit(cache, "key", agent)
+    assert third['Differential Attack']['time_spent'] == 1.5
+    assert cache.get("key")['expired_timing']['Differential Attack'] == {'time_spent': 1.5}
+
+
+def test_partial_attack_is_not_cached(tmp_path):
+    cache = AuditResultCache(path=str(tmp_path / "audits.sqlite3"))
+    agent = FakeAgent()
+    agent.run_full_audit = lambda **kwargs: {'Differential Attack': {'stopped_by': 'time', 'time_spent': 0.1}}
+
+    cached_full_audit(cache, "key", agent)
+    assert cache.get("key") is None